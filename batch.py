@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy batch evaluation of every placement of one piece.
+
+The placements of a piece are stacked as uint64 bitboards (one occupancy and
+one mask per color each), so placing, finding full lines, clearing, counting
+cleared colors and the RUN_COLORS run potential are a few array operations for
+all of them at once. Solvers turn the outcomes into candidate scores with the
+same operations, in the same order, as their scalar score function, so the
+ranking is identical.
+
+NumPy is optional: without it HAVE_NUMPY is False and callers keep the scalar
+path.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bitboard import (BOARD_SIZE, CLEAR_COLORS, COL_MASK, COLORS, FULL_MASK, ROW_MASK,
+                      RUN_SLOTS, RUN_SQUARES, placement_index)
+
+HAVE_NUMPY = np is not None
+
+if HAVE_NUMPY:
+    _RUN_SQUARES = np.array(RUN_SQUARES, dtype=np.int64)
+    _BIT_COUNTS = np.array([bin(v).count('1') for v in range(256)], dtype=np.int64)
+
+
+# ---------------- Array bit helpers ----------------
+def _u64(v):
+    return np.uint64(v)
+
+def popcount(a):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(a).astype(np.int64)
+    return _BIT_COUNTS[_bytes(a)].sum(axis=1)
+
+def _bytes(a):
+    # Byte i of every mask (row i of the board) as an (n, 8) array
+    return np.ascontiguousarray(a, dtype='<u8').view(np.uint8).reshape(-1, BOARD_SIZE)
+
+def transpose(m):
+    # bitboard.transpose on an array of masks
+    t = _u64(0x0F0F0F0F00000000) & (m ^ (m << _u64(28)))
+    m = m ^ t ^ (t >> _u64(28))
+    t = _u64(0x3333000033330000) & (m ^ (m << _u64(14)))
+    m = m ^ t ^ (t >> _u64(14))
+    t = _u64(0x5500550055005500) & (m ^ (m << _u64(7)))
+    m = m ^ t ^ (t >> _u64(7))
+    return m & _u64(FULL_MASK)
+
+def line_runs(m):
+    return _RUN_SQUARES[_bytes(m)].sum(axis=1)
+
+
+# ---------------- Placement batches ----------------
+class PlacementBatch:
+    """The placements of a PlacementIndex as arrays."""
+    __slots__ = ('index', 'rows', 'cols', 'occ', 'masks')
+
+    def __init__(self, index):
+        self.index = index
+        placements = index.placements
+        self.rows = np.array([pl[0] for pl in placements], dtype=np.int64)
+        self.cols = np.array([pl[1] for pl in placements], dtype=np.int64)
+        self.occ = np.array([pl[2] for pl in placements], dtype=np.uint64)
+        self.masks = np.array([pl[3] for pl in placements], dtype=np.uint64).reshape(-1, len(COLORS))
+
+
+_BATCHES = {}
+
+def placement_batch(index):
+    batch = _BATCHES.get(index.piece)
+    if batch is None:
+        batch = _BATCHES[index.piece] = PlacementBatch(index)
+    return batch
+
+
+class Outcomes:
+    """
+    Every placement of a piece that fits the board, after placing and clearing:
+    sel         positions in PlacementIndex.placements
+    r, c        anchors
+    cleared     (n, 3) cleared cells per CLEAR_COLORS
+    full_rows   (n, 8) bool, row i cleared
+    full_cols   (n, 8) bool, column i cleared
+    runs        squared run total of the RUN_COLORS on the board after
+    """
+    __slots__ = ('index', 'sel', 'r', 'c', 'cleared', 'row_bits', 'col_bits',
+                 'full_rows', 'full_cols', 'runs')
+
+    def __len__(self):
+        return len(self.sel)
+
+
+def placement_outcomes(board, piece, index=None):
+    if index is None:
+        index = placement_index(piece)
+    batch = placement_batch(index)
+    occ = _u64(board.occ)
+
+    out = Outcomes()
+    out.index = index
+    out.sel = np.flatnonzero((batch.occ & occ) == 0)
+    out.r = batch.rows[out.sel]
+    out.c = batch.cols[out.sel]
+
+    new_occ = batch.occ[out.sel] | occ
+    new_masks = batch.masks[out.sel] | np.array(board.masks, dtype=np.uint64)
+
+    x = new_occ & (new_occ >> _u64(4))
+    x &= x >> _u64(2)
+    x &= x >> _u64(1)
+    rows = x & _u64(COL_MASK)
+    x = new_occ & (new_occ >> _u64(32))
+    x &= x >> _u64(16)
+    x &= x >> _u64(8)
+    cols = x & _u64(ROW_MASK)
+    gone = (rows * _u64(ROW_MASK)) | (cols * _u64(COL_MASK))
+
+    out.row_bits = rows
+    out.col_bits = cols
+    out.full_rows = _bytes(rows) != 0
+    out.full_cols = ((cols[:, None] >> np.arange(BOARD_SIZE, dtype=np.uint64)) & _u64(1)) != 0
+    out.cleared = np.stack([popcount(new_masks[:, i] & gone)
+                            for i in range(len(CLEAR_COLORS))], axis=1)
+
+    keep = ~gone
+    runs = np.zeros(len(out.sel), dtype=np.int64)
+    for i in RUN_SLOTS:
+        m = new_masks[:, i] & keep
+        runs += line_runs(m) + line_runs(transpose(m))
+    out.runs = runs
+    return out
+
+
+def top_placements(out, scores, k):
+    """
+    The k best placements by score, best first, as
+    (r, c, occ_mask, color_masks, cleared, cleared_lines). Equal scores keep
+    placement order, like a stable sort of the scalar scores.
+    """
+    order = np.argsort(-scores, kind='stable')[:k]
+    placements = out.index.placements
+    top = []
+    for j in order.tolist():
+        r, c, occ_mask, color_masks = placements[int(out.sel[j])]
+        n = out.cleared[j].tolist()
+        cleared = dict(zip(CLEAR_COLORS, n))
+        rows = int(out.row_bits[j])
+        cols = int(out.col_bits[j])
+        cleared_lines = []
+        if rows or cols:
+            for i in range(BOARD_SIZE):
+                if rows >> (i * BOARD_SIZE) & 1:
+                    cleared_lines.append(('r', i))
+            for i in range(BOARD_SIZE):
+                if cols >> i & 1:
+                    cleared_lines.append(('c', i))
+        top.append((r, c, occ_mask, color_masks, cleared, cleared_lines))
+    return top
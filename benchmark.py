@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the block puzzle solvers.
+
+Runs suggest_best_sequence of solver7 and solver9 (their headless *_core
+modules) over the versioned corpus in bench_corpus.json (the fixed
+apply_initial_setup board and mid-game boards, 1-8 pieces each) and writes one
+JSON record per solver, mode and case: wall time, search nodes, nodes/sec,
+peak traced memory and plan quality (steps to the solver's goal, overkill
+cells).
+
+    python benchmark.py                          # every case, dfs and beam
+    python benchmark.py --max-pieces 3 --modes dfs
+    python benchmark.py --baseline old.json      # compare with an earlier run
+    python benchmark.py --generate-corpus        # rewrite the corpus file
+
+The corpus is generated from a fixed seed; change CORPUS_VERSION whenever it
+is regenerated so results of different corpora are never compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from bitboard import BOARD_SIZE, Board
+from search import Certificate, SearchControl, SearchStats
+from solve import load_engine, parse_puzzle
+
+# ---------------- CONFIG ----------------
+CORPUS_VERSION = 1
+CORPUS_SEED = 7
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus.json')
+DEFAULT_OUT = 'bench_results.json'
+SOLVERS = ('solver7', 'solver9')
+MODES = ('dfs', 'beam')
+# Full DFS grows with the number of piece orders; larger cases are skipped
+DFS_MAX_PIECES = 4
+# Same for the exact mode (run it with --modes exact)
+EXACT_MAX_PIECES = 6
+TARGET = {'yellow': 10, 'green': 5, 'red': 5}
+PIECE_COLORS = ('yellow', 'green', 'red', 'brown')
+
+
+# ---------------- Corpus ----------------
+def random_piece(rng):
+    # 1-4 blocks in the 4x4 editor grid, normalised and row-major like PieceEditor
+    cells = set()
+    n = rng.randint(1, 4)
+    while len(cells) < n:
+        cells.add((rng.randrange(4), rng.randrange(4)))
+    minr = min(r for r, _ in cells)
+    minc = min(c for _, c in cells)
+    return [(r - minr, c - minc, rng.choice(PIECE_COLORS)) for r, c in sorted(cells)]
+
+def random_board(rng):
+    # Mid-game board: random fill, a few nearly full lines, no full line left
+    board = Board()
+    fill = rng.uniform(0.25, 0.5)
+    for r in range(BOARD_SIZE):
+        for c in range(BOARD_SIZE):
+            if rng.random() < fill:
+                board.set_cell(r, c, rng.choice(PIECE_COLORS))
+    for _ in range(rng.randint(1, 3)):
+        r = rng.randrange(BOARD_SIZE)
+        for c in range(BOARD_SIZE):
+            if rng.random() < 0.8:
+                board.set_cell(r, c, rng.choice(PIECE_COLORS))
+    board.clear_lines()
+    return board.to_grid()
+
+def generate_corpus(seed=CORPUS_SEED):
+    rng = random.Random(seed)
+    cases = []
+    for n in range(1, 9):
+        cases.append({
+            'name': f'initial-{n}p',
+            'board': 'initial',
+            'counts': {'yellow': 0, 'green': 0, 'red': 0},
+            'pieces': [random_piece(rng) for _ in range(n)],
+        })
+    for k in range(2):
+        for n in range(1, 9):
+            cases.append({
+                'name': f'mid{k + 1}-{n}p',
+                'board': random_board(rng),
+                'counts': {col: rng.randint(0, TARGET[col] - 1) for col in TARGET},
+                'pieces': [random_piece(rng) for _ in range(n)],
+            })
+    return {'version': CORPUS_VERSION, 'seed': seed, 'cases': cases}
+
+def write_corpus(corpus, path=CORPUS_FILE):
+    # One case per line keeps the file readable and its diffs small
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'{{"version": {corpus["version"]}, "seed": {corpus["seed"]}, "cases": [\n')
+        f.write(',\n'.join(json.dumps(case) for case in corpus['cases']))
+        f.write('\n]}\n')
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+    if corpus.get('version') != CORPUS_VERSION:
+        raise ValueError(f"{path}: corpus version {corpus.get('version')}, "
+                         f"expected {CORPUS_VERSION}")
+    return corpus
+
+
+# ---------------- Measuring ----------------
+def plan_quality(solver, counts, plan):
+    # Steps until the solver's own goal holds (None if never) and overkill cells
+    counts = dict(counts)
+    steps = None
+    overkill = 0
+    for i, (_, _, cleared) in enumerate(plan or []):
+        for col in ('yellow', 'green', 'red'):
+            rem = max(0, solver.TARGET[col] - counts.get(col, 0))
+            overkill += max(0, cleared.get(col, 0) - rem)
+        for col in cleared:
+            counts[col] = counts.get(col, 0) + cleared[col]
+        if steps is None and solver.OBJECTIVE.goal_reached(counts):
+            steps = i + 1
+    return steps, overkill, counts
+
+def solve(solver, mode, case):
+    board, counts, pieces = parse_puzzle(case, solver)
+    # A fresh MCTS tree and DFS warm start per case keep runs independent
+    # of case order and of the earlier timing pass
+    solver._MCTS_TREE = None
+    solver._WARM_START = None
+    control = SearchControl()
+    stats = SearchStats()
+    certificate = Certificate() if mode == 'exact' else None
+    start = time.perf_counter()
+    plan = solver.suggest_best_sequence(board, counts, pieces, workers=1, control=control,
+                                        mode=mode, stats=stats, certificate=certificate)
+    return plan, time.perf_counter() - start, control.nodes, stats, certificate
+
+def run_case(solver_name, solver, mode, case, memory=True):
+    record = {'solver': solver_name, 'mode': mode, 'case': case['name'],
+              'pieces': len(case['pieces'])}
+    max_pieces = {'dfs': DFS_MAX_PIECES, 'exact': EXACT_MAX_PIECES}.get(mode)
+    if max_pieces is not None and len(case['pieces']) > max_pieces:
+        record['status'] = 'skipped'
+        return record
+
+    plan, wall, nodes, stats, certificate = solve(solver, mode, case)
+    record['wall_s'] = round(wall, 4)
+    record['nodes'] = nodes
+    record['nodes_per_s'] = round(nodes / wall, 1) if wall > 0 else None
+    record['stats'] = stats.as_dict()
+    if certificate is not None:
+        record['certificate'] = certificate.as_dict()
+    if memory:
+        # Separate run: tracing slows the search down too much to time it
+        tracemalloc.start()
+        try:
+            solve(solver, mode, case)
+            record['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+    steps, overkill, final = plan_quality(solver, case['counts'], plan)
+    record['status'] = 'ok' if plan else 'no-plan'
+    record['steps'] = steps
+    record['overkill'] = overkill
+    record['placed'] = sum(1 for _, pos, _ in plan or [] if pos is not None)
+    record['final_counts'] = final
+    return record
+
+def summarize(results):
+    summary = []
+    keys = []
+    for rec in results:
+        key = (rec['solver'], rec['mode'])
+        if key not in keys:
+            keys.append(key)
+    for solver_name, mode in keys:
+        runs = [r for r in results if r['solver'] == solver_name and r['mode'] == mode
+                and r['status'] != 'skipped']
+        wall = sum(r['wall_s'] for r in runs)
+        nodes = sum(r['nodes'] for r in runs)
+        summary.append({
+            'solver': solver_name,
+            'mode': mode,
+            'cases': len(runs),
+            'wall_s': round(wall, 4),
+            'nodes': nodes,
+            'nodes_per_s': round(nodes / wall, 1) if wall > 0 else None,
+            'peak_kb': max((r.get('peak_kb', 0) for r in runs), default=0),
+            'goal_reached': sum(1 for r in runs if r.get('steps') is not None),
+            'overkill': sum(r.get('overkill', 0) for r in runs),
+        })
+    return summary
+
+def solver_config(solver):
+    names = ('TOP_K_CANDIDATES', 'MAX_DFS_NODES', 'BEAM_WIDTH', 'MCTS_ITERATIONS',
+             'EXACT_MAX_NODES', 'BATCH_SCORING')
+    return {name: getattr(solver, name) for name in names if hasattr(solver, name)}
+
+
+# ---------------- Comparing ----------------
+def compare(results, baseline):
+    """
+    Print per-case changes against an earlier results file. Returns the
+    number of cases whose plan got worse (later goal, goal lost, more overkill).
+    """
+    if baseline.get('corpus_version') != CORPUS_VERSION:
+        print(f"Baseline uses corpus version {baseline.get('corpus_version')}, "
+              f"not {CORPUS_VERSION}; not comparable.")
+        return 0
+    old = {(r['solver'], r['mode'], r['case']): r for r in baseline['results']}
+    worse = 0
+    for rec in results:
+        prev = old.get((rec['solver'], rec['mode'], rec['case']))
+        if prev is None or 'skipped' in (rec['status'], prev['status']):
+            continue
+        notes = []
+        if rec['steps'] != prev['steps']:
+            new_steps = rec['steps'] if rec['steps'] is not None else float('inf')
+            old_steps = prev['steps'] if prev['steps'] is not None else float('inf')
+            if new_steps > old_steps:
+                notes.append(f"steps {prev['steps']} -> {rec['steps']} WORSE")
+            else:
+                notes.append(f"steps {prev['steps']} -> {rec['steps']}")
+        if rec['overkill'] > prev['overkill']:
+            notes.append(f"overkill {prev['overkill']} -> {rec['overkill']} WORSE")
+        if any(n.endswith('WORSE') for n in notes):
+            worse += 1
+        ratio = rec['wall_s'] / prev['wall_s'] if prev['wall_s'] else float('inf')
+        print(f"{rec['solver']:8} {rec['mode']:5} {rec['case']:14} "
+              f"time x{ratio:5.2f}  {'; '.join(notes)}")
+    return worse
+
+
+# ---------------- Main ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark solver7 and solver9.")
+    parser.add_argument('--corpus', default=CORPUS_FILE)
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--solvers', default=','.join(SOLVERS))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--cases', default=None, help="comma-separated case names")
+    parser.add_argument('--max-pieces', type=int, default=None)
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory runs")
+    parser.add_argument('--baseline', default=None, help="earlier results file to compare with")
+    parser.add_argument('--generate-corpus', action='store_true',
+                        help="write a fresh corpus to --corpus and exit")
+    args = parser.parse_args(argv)
+
+    if args.generate_corpus:
+        write_corpus(generate_corpus(), args.corpus)
+        print(f"Wrote {args.corpus}")
+        return 0
+
+    corpus = load_corpus(args.corpus)
+    cases = corpus['cases']
+    if args.cases:
+        wanted = set(args.cases.split(','))
+        cases = [c for c in cases if c['name'] in wanted]
+    if args.max_pieces is not None:
+        cases = [c for c in cases if len(c['pieces']) <= args.max_pieces]
+
+    solvers = {name: load_engine(name) for name in args.solvers.split(',')}
+    results = []
+    for name, solver in solvers.items():
+        for mode in args.modes.split(','):
+            for case in cases:
+                rec = run_case(name, solver, mode, case, memory=not args.no_memory)
+                results.append(rec)
+                if rec['status'] == 'skipped':
+                    print(f"{name:8} {mode:5} {case['name']:14} skipped")
+                else:
+                    print(f"{name:8} {mode:5} {case['name']:14} {rec['wall_s']:8.3f}s "
+                          f"{rec['nodes_per_s'] or 0:10.0f} nodes/s  steps {rec['steps']}  "
+                          f"overkill {rec['overkill']}")
+
+    report = {
+        'corpus_version': corpus['version'],
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {name: solver_config(solver) for name, solver in solvers.items()},
+        'results': results,
+        'summary': summarize(results),
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+        f.write('\n')
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            worse = compare(results, json.load(f))
+        if worse:
+            print(f"{worse} case(s) got worse")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
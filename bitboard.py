@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bitboard engine for the 8x8 block puzzle solvers.
+
+Cell (r, c) is bit r*8 + c. A board is one occupancy mask plus one mask per
+color, so placement checks, full row/column detection, clears and per-color
+clear counts are a handful of AND/OR/popcount operations instead of grid scans.
+
+Boards also keep per-row and per-column fill counts, packed 4 bits per line
+(line i in bits 4i..4i+3). A placement adds its own precomputed counts, and a
+line is full exactly when bit 3 of its nibble is set, so the check after a
+move is one AND instead of a scan of all 16 lines.
+
+For RUN_COLORS the board keeps the transposed color masks and the sum of
+squared run lengths over all rows and columns. A placement updates only the
+lines its blocks of that color touch; clears and direct edits recompute.
+"""
+
+import math
+
+# ---------------- CONFIG ----------------
+BOARD_SIZE = 8
+COLORS = ('yellow', 'green', 'red', 'brown')
+CLEAR_COLORS = ('yellow', 'green', 'red')
+COLOR_INDEX = {col: i for i, col in enumerate(COLORS)}
+# Colors whose run potential Board keeps up to date (see cluster_runs)
+RUN_COLORS = ('green', 'red')
+RUN_SLOTS = tuple(COLOR_INDEX[col] for col in RUN_COLORS)
+
+FULL_MASK = (1 << (BOARD_SIZE * BOARD_SIZE)) - 1
+ROW_MASK = 0xFF
+COL_MASK = 0x0101010101010101
+FULL_LINES = 0x88888888
+
+# Sum of squared run lengths of set bits for every 8-bit line
+RUN_SQUARES = []
+for _v in range(1 << BOARD_SIZE):
+    _s = 0
+    _run = 0
+    for _i in range(BOARD_SIZE):
+        if _v >> _i & 1:
+            _run += 1
+        else:
+            _s += _run * _run
+            _run = 0
+    RUN_SQUARES.append(_s + _run * _run)
+del _v, _s, _run, _i
+
+
+# ---------------- Bit helpers ----------------
+def cell_bit(r, c):
+    return 1 << (r * BOARD_SIZE + c)
+
+def transpose(m):
+    # Flip about the main diagonal: bit r*8+c moves to c*8+r
+    t = 0x0F0F0F0F00000000 & (m ^ (m << 28))
+    m ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (m ^ (m << 14))
+    m ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (m ^ (m << 7))
+    m ^= t ^ (t >> 7)
+    return m & FULL_MASK
+
+def full_rows(occ):
+    # Bit 8*r is set iff row r is full
+    x = occ & (occ >> 4)
+    x &= x >> 2
+    x &= x >> 1
+    return x & COL_MASK
+
+def full_cols(occ):
+    # Bit c is set iff column c is full
+    x = occ & (occ >> 32)
+    x &= x >> 16
+    x &= x >> 8
+    return x & ROW_MASK
+
+def piece_masks(piece, r, c):
+    # Occupancy mask and per-color masks for piece anchored at (r, c),
+    # or None when any block falls off the board
+    occ = 0
+    color_masks = [0] * len(COLORS)
+    for dy, dx, col in piece:
+        rr = r + dy
+        cc = c + dx
+        if rr < 0 or rr >= BOARD_SIZE or cc < 0 or cc >= BOARD_SIZE:
+            return None
+        bit = cell_bit(rr, cc)
+        occ |= bit
+        color_masks[COLOR_INDEX[col]] |= bit
+    return occ, color_masks
+
+def line_counts(m):
+    # Set bits per row and per column of m as packed nibbles
+    t = transpose(m)
+    rows = 0
+    cols = 0
+    for i in range(BOARD_SIZE):
+        shift = i * BOARD_SIZE
+        rows |= ((m >> shift) & ROW_MASK).bit_count() << (4 * i)
+        cols |= ((t >> shift) & ROW_MASK).bit_count() << (4 * i)
+    return rows, cols
+
+_PLACEMENT_COUNTS = {}
+
+def placement_counts(occ_mask):
+    # line_counts of a piece mask, memoised since the same masks recur
+    counts = _PLACEMENT_COUNTS.get(occ_mask)
+    if counts is None:
+        counts = _PLACEMENT_COUNTS[occ_mask] = line_counts(occ_mask)
+    return counts
+
+def line_runs(m):
+    s = 0
+    for shift in range(0, BOARD_SIZE * BOARD_SIZE, BOARD_SIZE):
+        s += RUN_SQUARES[(m >> shift) & ROW_MASK]
+    return s
+
+def mask_runs(m):
+    # Squared run lengths over all rows and columns of m
+    return line_runs(m) + line_runs(transpose(m)) if m else 0
+
+_RUN_LINES = {}
+
+def run_lines(m):
+    # (row shifts touched by m, transpose(m), column shifts touched by m)
+    lines = _RUN_LINES.get(m)
+    if lines is None:
+        t = transpose(m)
+        shifts = range(0, BOARD_SIZE * BOARD_SIZE, BOARD_SIZE)
+        lines = _RUN_LINES[m] = (tuple(s for s in shifts if (m >> s) & ROW_MASK), t,
+                                 tuple(s for s in shifts if (t >> s) & ROW_MASK))
+    return lines
+
+def fullest_line(m):
+    # Most set bits in any single 8-bit line
+    most = 0
+    for shift in range(0, BOARD_SIZE * BOARD_SIZE, BOARD_SIZE):
+        n = ((m >> shift) & ROW_MASK).bit_count()
+        if n > most:
+            most = n
+    return most
+
+
+# ---------------- Pieces ----------------
+def normalize_blocks(blocks):
+    # (dy, dx, color) blocks shifted to row/column 0 and sorted row-major
+    blocks = [tuple(b) for b in blocks]
+    if not blocks:
+        raise ValueError("a piece needs at least one block")
+    minr = min(b[0] for b in blocks)
+    minc = min(b[1] for b in blocks)
+    blocks = sorted((dy - minr, dx - minc, col) for dy, dx, col in blocks)
+    cells = set()
+    for dy, dx, col in blocks:
+        if col not in COLOR_INDEX:
+            raise ValueError(f"unknown piece color: {col!r}")
+        if dy >= BOARD_SIZE or dx >= BOARD_SIZE:
+            raise ValueError("piece does not fit on the board")
+        if (dy, dx) in cells:
+            raise ValueError(f"two blocks on cell {(dy, dx)}")
+        cells.add((dy, dx))
+    return tuple(blocks)
+
+
+class Piece:
+    """
+    Immutable, interned piece. Piece(blocks) normalizes the (dy, dx, color)
+    blocks (see normalize_blocks) and returns the one Piece for that shape, so
+    equal pieces are the same object: == and hash go by identity, and a Piece
+    is a cheap dict key. It iterates, indexes and has a len like its blocks.
+
+    blocks         normalized ((dy, dx, color), ...)
+    occ, masks     occupancy and per-COLORS masks anchored at (0, 0)
+    height, width  bounding box
+    spans          most blocks in one row, in one column
+    color_counts   blocks per COLORS
+    """
+    __slots__ = ('blocks', 'occ', 'masks', 'height', 'width', 'spans', 'color_counts', 'hash')
+
+    def __new__(cls, blocks):
+        if isinstance(blocks, Piece):
+            return blocks
+        blocks = normalize_blocks(blocks)
+        piece = _PIECES.get(blocks)
+        if piece is None:
+            piece = _PIECES[blocks] = object.__new__(cls)
+            occ, masks = piece_masks(blocks, 0, 0)
+            rows = {}
+            cols = {}
+            for dy, dx, _ in blocks:
+                rows[dy] = rows.get(dy, 0) + 1
+                cols[dx] = cols.get(dx, 0) + 1
+            init = object.__setattr__
+            init(piece, 'blocks', blocks)
+            init(piece, 'occ', occ)
+            init(piece, 'masks', tuple(masks))
+            init(piece, 'height', max(rows) + 1)
+            init(piece, 'width', max(cols) + 1)
+            init(piece, 'spans', (max(rows.values()), max(cols.values())))
+            init(piece, 'color_counts', tuple(m.bit_count() for m in masks))
+            init(piece, 'hash', hash(blocks))
+        return piece
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Piece is immutable")
+
+    def __reduce__(self):
+        # Unpickles (and deep-copies) to the interned Piece of the receiving process
+        return (Piece, (self.blocks,))
+
+    def __hash__(self):
+        return self.hash
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, i):
+        return self.blocks[i]
+
+    def __repr__(self):
+        return f"Piece({list(self.blocks)!r})"
+
+
+_PIECES = {}
+
+
+# ---------------- Bounds ----------------
+def piece_spans(piece):
+    # Most blocks the piece puts into one row and into one column
+    return Piece(piece).spans
+
+def placements_to_clear(occ, pieces):
+    """
+    Fewest placements of pieces before any row or column can be full, or inf.
+    Nothing leaves the board before the first clear and a piece adds at most
+    its span to one line, so this never overestimates.
+    """
+    spans = [piece_spans(piece) for piece in pieces]
+    best = math.inf
+    for empty, line_spans in ((BOARD_SIZE - fullest_line(occ), [s[0] for s in spans]),
+                              (BOARD_SIZE - fullest_line(transpose(occ)), [s[1] for s in spans])):
+        if empty <= 0:
+            return 0
+        line_spans.sort(reverse=True)
+        filled = 0
+        for k, span in enumerate(line_spans, 1):
+            filled += span
+            if filled >= empty:
+                best = min(best, k)
+                break
+    return best
+
+def live_cells(occ, pieces):
+    """
+    Cells of the rows and columns pieces could still fill. A piece adds at
+    most its span to one line and clears only empty lines further, so a line
+    with more empty cells than the spans of all pieces together never clears;
+    a placement with no block in this mask cannot take part in any clear.
+    """
+    spans = [piece_spans(piece) for piece in pieces]
+    row_supply = sum(s[0] for s in spans)
+    col_supply = sum(s[1] for s in spans)
+    t = transpose(occ)
+    live = 0
+    for i in range(BOARD_SIZE):
+        shift = i * BOARD_SIZE
+        if BOARD_SIZE - ((occ >> shift) & ROW_MASK).bit_count() <= row_supply:
+            live |= ROW_MASK << shift
+        if BOARD_SIZE - ((t >> shift) & ROW_MASK).bit_count() <= col_supply:
+            live |= COL_MASK << i
+    return live
+
+def color_supply(board, pieces, col):
+    # Cells of col that could still be cleared: on the board or in the pieces
+    i = COLOR_INDEX[col]
+    n = board.masks[i].bit_count()
+    for piece in pieces:
+        n += Piece(piece).color_counts[i]
+    return n
+
+
+# ---------------- Board ----------------
+class Board:
+    __slots__ = ('occ', 'masks', 'rows', 'cols', 'tmasks', 'runs')
+
+    def __init__(self, occ=0, masks=None):
+        self.occ = occ
+        self.masks = masks if masks is not None else [0] * len(COLORS)
+        self.rows, self.cols = line_counts(occ)
+        self._refresh_runs()
+
+    def _refresh_runs(self):
+        # tmasks and runs are replaced, never mutated, so copies and undo
+        # records can share them
+        masks = self.masks
+        self.tmasks = [transpose(masks[i]) for i in RUN_SLOTS]
+        self.runs = [line_runs(masks[i]) + line_runs(t) for i, t in zip(RUN_SLOTS, self.tmasks)]
+
+    @classmethod
+    def from_grid(cls, grid):
+        board = cls()
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                if grid[r][c] is not None:
+                    board.set_cell(r, c, grid[r][c])
+        return board
+
+    def to_grid(self):
+        return [[self.cell(r, c) for c in range(BOARD_SIZE)] for r in range(BOARD_SIZE)]
+
+    def __reduce__(self):
+        return (Board, (self.occ, self.masks))
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.occ = self.occ
+        board.masks = self.masks[:]
+        board.rows = self.rows
+        board.cols = self.cols
+        board.tmasks = self.tmasks
+        board.runs = self.runs
+        return board
+
+    def key(self):
+        return (self.occ, *self.masks)
+
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def cell(self, r, c):
+        bit = cell_bit(r, c)
+        if not self.occ & bit:
+            return None
+        for i, m in enumerate(self.masks):
+            if m & bit:
+                return COLORS[i]
+        return None
+
+    def set_cell(self, r, c, col):
+        bit = cell_bit(r, c)
+        masks = self.masks
+        for i in range(len(masks)):
+            masks[i] &= ~bit
+        was_set = bool(self.occ & bit)
+        if col is None:
+            self.occ &= ~bit
+        else:
+            masks[COLOR_INDEX[col]] |= bit
+            self.occ |= bit
+        if was_set != (col is not None):
+            delta = 1 if col is not None else -1
+            self.rows += delta << (4 * r)
+            self.cols += delta << (4 * c)
+        self._refresh_runs()
+
+    def fits(self, mask):
+        return not self.occ & mask
+
+    def place(self, occ_mask, color_masks):
+        # color_masks is indexed like COLORS; caller has checked fits()
+        self.occ |= occ_mask
+        rows, cols = placement_counts(occ_mask)
+        self.rows += rows
+        self.cols += cols
+        masks = self.masks
+        for i, m in enumerate(color_masks):
+            if m:
+                masks[i] |= m
+        self._refresh_runs()
+
+    def clear_lines(self):
+        cleared, cleared_lines, _, _ = self._clear()
+        return cleared, cleared_lines
+
+    def _clear(self):
+        # clear_lines plus the cleared cells and their per-color masks
+        cleared = {'yellow': 0, 'green': 0, 'red': 0}
+        if not (self.rows | self.cols) & FULL_LINES:
+            return cleared, [], 0, None
+        occ = self.occ
+        rows = full_rows(occ)
+        cols = full_cols(occ)
+
+        cleared_lines = []
+        for r in range(BOARD_SIZE):
+            if rows >> (r * BOARD_SIZE) & 1:
+                cleared_lines.append(('r', r))
+        for c in range(BOARD_SIZE):
+            if cols >> c & 1:
+                cleared_lines.append(('c', c))
+
+        gone = rows * ROW_MASK | cols * COL_MASK
+        keep = ~gone
+        masks = self.masks
+        gone_masks = tuple(m & gone for m in masks)
+        for i, col in enumerate(CLEAR_COLORS):
+            cleared[col] = gone_masks[i].bit_count()
+        for i in range(len(masks)):
+            masks[i] &= keep
+        self.occ = occ & keep
+        self.rows, self.cols = line_counts(self.occ)
+        self._refresh_runs()
+        return cleared, cleared_lines, gone, gone_masks
+
+    def make(self, occ_mask, color_masks):
+        """
+        Place a piece in place, overwriting any cells under it like set_cell,
+        then clear full lines. Returns (cleared, cleared_lines, undo); undo holds
+        the placed cells, the colors they covered, the cleared cells with their
+        colors, the line counts and the run potential, and unmake(undo)
+        restores the board exactly.
+        """
+        occ = self.occ
+        masks = self.masks
+        rows = self.rows
+        cols = self.cols
+        tmasks = self.tmasks
+        runs = self.runs
+        covered_occ = occ & occ_mask
+        if covered_occ:
+            covered = tuple(m & occ_mask for m in masks)
+            keep = ~occ_mask
+            for i in range(len(masks)):
+                masks[i] &= keep
+            add_rows, add_cols = line_counts(occ_mask & ~covered_occ)
+        else:
+            covered = None
+            add_rows, add_cols = placement_counts(occ_mask)
+            # Only lines holding new blocks of a run color change its runs
+            new_tmasks = None
+            for j, i in enumerate(RUN_SLOTS):
+                m = color_masks[i]
+                if m:
+                    if new_tmasks is None:
+                        new_tmasks = tmasks[:]
+                        new_runs = runs[:]
+                    row_shifts, tm, col_shifts = run_lines(m)
+                    old = masks[i]
+                    new = old | m
+                    told = tmasks[j]
+                    tnew = told | tm
+                    d = 0
+                    for s in row_shifts:
+                        d += RUN_SQUARES[(new >> s) & ROW_MASK] - RUN_SQUARES[(old >> s) & ROW_MASK]
+                    for s in col_shifts:
+                        d += RUN_SQUARES[(tnew >> s) & ROW_MASK] - RUN_SQUARES[(told >> s) & ROW_MASK]
+                    new_tmasks[j] = tnew
+                    new_runs[j] = runs[j] + d
+            if new_tmasks is not None:
+                self.tmasks = new_tmasks
+                self.runs = new_runs
+        for i, m in enumerate(color_masks):
+            if m:
+                masks[i] |= m
+        self.occ = occ | occ_mask
+        self.rows = rows + add_rows
+        self.cols = cols + add_cols
+        if covered_occ:
+            self._refresh_runs()
+        cleared, cleared_lines, gone, gone_masks = self._clear()
+        return cleared, cleared_lines, (occ_mask, covered_occ, covered, gone, gone_masks,
+                                        rows, cols, tmasks, runs)
+
+    def unmake(self, undo):
+        (occ_mask, covered_occ, covered, gone, gone_masks,
+         self.rows, self.cols, self.tmasks, self.runs) = undo
+        keep = ~occ_mask
+        masks = self.masks
+        if gone:
+            for i in range(len(masks)):
+                masks[i] = (masks[i] | gone_masks[i]) & keep
+        else:
+            for i in range(len(masks)):
+                masks[i] &= keep
+        if covered is not None:
+            for i in range(len(masks)):
+                masks[i] |= covered[i]
+        self.occ = ((self.occ | gone) & keep) | covered_occ
+
+    def recolor(self, src, dst):
+        i = COLOR_INDEX[src]
+        self.masks[COLOR_INDEX[dst]] |= self.masks[i]
+        self.masks[i] = 0
+        self._refresh_runs()
+
+    def cluster_runs(self, colors):
+        # Sum of squared same-color run lengths over all rows and columns;
+        # kept up to date for RUN_COLORS, computed on the spot for the others
+        s = 0
+        for col in colors:
+            if col in _RUN_SLOT:
+                s += self.runs[_RUN_SLOT[col]]
+            else:
+                s += mask_runs(self.masks[COLOR_INDEX[col]])
+        return s
+
+
+_RUN_SLOT = {col: j for j, col in enumerate(RUN_COLORS)}
+
+
+# ---------------- Placement index ----------------
+class PlacementIndex:
+    """
+    Every in-bounds anchor of one piece with its ready-made occupancy mask and
+    per-color masks, in the same row-major order as the plain anchor scan.
+    """
+    __slots__ = ('piece', 'placements')
+
+    def __init__(self, piece):
+        self.piece = tuple(piece)
+        self.placements = []
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                masks = piece_masks(piece, r, c)
+                if masks is not None:
+                    occ, color_masks = masks
+                    self.placements.append((r, c, occ, tuple(color_masks)))
+
+    def __reduce__(self):
+        # Unpickles to the memoised index of the receiving process
+        return (placement_index, (self.piece,))
+
+    def fitting(self, occ):
+        return [pl for pl in self.placements if not occ & pl[2]]
+
+
+_PLACEMENT_INDEX = {}
+
+def placement_index(piece):
+    key = tuple(piece)
+    index = _PLACEMENT_INDEX.get(key)
+    if index is None:
+        index = _PLACEMENT_INDEX[key] = PlacementIndex(key)
+    return index
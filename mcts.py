@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo tree search for the 8x8 block puzzle solvers.
+
+Actions are (next piece, placement) like in PlanSearch, with each node's moves
+limited to the top_k scored placements of every remaining piece. Selection is
+UCT, leaves are finished with cheap greedy or random rollouts, and every
+playout is judged by the solver's own Objective. The best complete plan of any
+playout is returned, so the answer is always a real plan, not just a first
+move.
+
+Nodes are keyed by search state (board, counts, remaining pieces), so a tree
+kept between calls picks up its statistics again once the puzzle reaches a
+state it has already seen, e.g. after the suggested first piece was placed.
+"""
+
+import math
+import random
+import time
+
+from search import NO_CLEAR, PlanSearch, chain
+
+# ---------------- CONFIG ----------------
+MCTS_EXPLORATION = 1.4
+MCTS_MAX_NODES = 200000
+# Share of the playout reward that comes from reaching the goal early; the
+# rest comes from the score, normalised over the scores seen so far
+MCTS_STEPS_WEIGHT = 0.75
+
+
+class MCTSNode:
+    __slots__ = ('visits', 'reward', 'edges', 'tried')
+
+    def __init__(self):
+        self.visits = 0
+        self.reward = 0.0
+        self.edges = None   # [move, child node] in best-first order, once expanded
+        self.tried = 0
+
+
+class MCTSTree:
+    """
+    Node table and statistics that outlive single searches. rollout is
+    'greedy' (best-scored placement of a random remaining piece) or 'random'.
+    """
+
+    def __init__(self, rollout='greedy', seed=None, max_nodes=MCTS_MAX_NODES):
+        if rollout not in ('greedy', 'random'):
+            raise ValueError(f"unknown rollout policy: {rollout}")
+        self.rollout = rollout
+        self.rng = random.Random(seed)
+        self.max_nodes = max_nodes
+        self.nodes = {}
+        self.score_lo = math.inf
+        self.score_hi = -math.inf
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def clear(self):
+        self.nodes.clear()
+        self.score_lo = math.inf
+        self.score_hi = -math.inf
+
+    def node(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            if len(self.nodes) >= self.max_nodes:
+                self.clear()
+            node = self.nodes[key] = MCTSNode()
+        return node
+
+    def root(self, key):
+        # A root the tree has not seen starts another puzzle, whose rewards
+        # must not be scaled by the score range of the last one
+        if key not in self.nodes:
+            self.score_lo = math.inf
+            self.score_hi = -math.inf
+        return self.node(key)
+
+    def reward(self, steps, total, score):
+        # Fewer steps to goal dominate; the score breaks the rest
+        self.score_lo = min(self.score_lo, score)
+        self.score_hi = max(self.score_hi, score)
+        span = self.score_hi - self.score_lo
+        s = (score - self.score_lo) / span if span > 0 else 0.5
+        g = (total + 1 - steps) / total if steps <= total else 0.0
+        return MCTS_STEPS_WEIGHT * g + (1.0 - MCTS_STEPS_WEIGHT) * s
+
+
+class MCTSSearch(PlanSearch):
+    """PlanSearch moves and plans driven by UCT instead of depth-first search."""
+
+    def __init__(self, objective, pieces, indexes, top_k, tree, control=None, stats=None):
+        super().__init__(objective, pieces, indexes, top_k, math.inf, control=control,
+                         best_first=True, stats=stats)
+        self.tree = tree
+
+    def rest(self, remaining, pid):
+        j = self.rank[pid]
+        return remaining[:j] + (remaining[j] - 1,) + remaining[j + 1:]
+
+    def edges(self, step, board, counts, remaining):
+        # Try the best placement of every piece before any second-best one
+        moves = self.children(step, board, counts, remaining)
+        seen = {}
+        order = []
+        for i, move in enumerate(moves):
+            k = seen.get(move[0], 0)
+            seen[move[0]] = k + 1
+            order.append((k, i))
+        order.sort()
+        return [[moves[i], None] for _, i in order]
+
+    def select(self, node):
+        # UCT over the tried edges of a fully tried node
+        log_n = math.log(node.visits)
+        best = None
+        best_uct = -math.inf
+        for edge in node.edges:
+            child = edge[1]
+            if child.visits:
+                uct = (child.reward / child.visits +
+                       MCTS_EXPLORATION * math.sqrt(log_n / child.visits))
+            else:
+                uct = math.inf
+            if uct > best_uct:
+                best = edge
+                best_uct = uct
+        return best
+
+    def rollout_move(self, board, counts, remaining):
+        # A move like children() gives, for a random remaining piece
+        rng = self.tree.rng
+        slots = [j for j, n in enumerate(remaining) if n]
+        pid = self.pids[rng.choice(slots)]
+        objective = self.objective
+        if self.tree.rollout == 'random':
+            cands = objective.candidates(board, self.group_pieces[pid], self.group_indexes[pid])
+            if not cands:
+                return (pid, None, None, None, NO_CLEAR, [], None, None,
+                        objective.placement_value(counts, NO_CLEAR))
+            r, c, occ_mask, color_masks = rng.choice(cands)
+            cleared, cleared_lines, undo = board.make(occ_mask, color_masks)
+            board.unmake(undo)
+        else:
+            top = self.top_candidates(board, counts, pid, 1)
+            if not top:
+                return (pid, None, None, None, NO_CLEAR, [], None, None,
+                        objective.placement_value(counts, NO_CLEAR))
+            r, c, occ_mask, color_masks, cleared, cleared_lines = top[0]
+        return (pid, None, r, c, cleared, cleared_lines, occ_mask, color_masks,
+                objective.placement_value(counts, cleared))
+
+    def playout(self, root, board, counts, remaining):
+        """
+        One selection, expansion, rollout and backup from root. Returns the
+        finished playout as (steps, value, potential, finish).
+        """
+        tree = self.tree
+        objective = self.objective
+        path = [root]
+        applied = []
+        finish = []
+        value = 0.0
+        steps = math.inf
+        node = root
+        step = 0
+
+        while step < self.total:
+            if node is not None and node.edges is None:
+                node.edges = self.edges(step, board, counts, remaining)
+            if node is not None and node.tried >= len(node.edges):
+                edge = self.select(node)
+                move = edge[0]
+            elif node is not None:
+                edge = node.edges[node.tried]
+                node.tried += 1
+                move = edge[0]
+            else:
+                edge = None
+                move = self.rollout_move(board, counts, remaining)
+
+            pid = move[0]
+            remaining = self.rest(remaining, pid)
+            value += move[8]
+            applied.append((move, self.make(board, counts, move)))
+            finish.append((pid, move[2], move[3], move[4], move[5]))
+            step += 1
+            if steps == math.inf and objective.goal_reached(counts):
+                steps = step
+
+            if edge is not None:
+                if edge[1] is None:
+                    # Expansion: the first visit below this edge ends the tree walk
+                    edge[1] = tree.node(self.state_key(step, board, counts, remaining))
+                    path.append(edge[1])
+                    node = None
+                else:
+                    node = edge[1]
+                    path.append(node)
+
+        _, bonus, potential, _ = self.leaf(board, counts)
+        value += bonus
+        for move, undo in reversed(applied):
+            self.unmake(board, counts, move, undo)
+
+        reward = tree.reward(steps, self.total, value + potential)
+        for n in path:
+            n.visits += 1
+            n.reward += reward
+        return (steps, value, potential, chain(finish))
+
+    def run_mcts(self, board, counts, iterations=None, deadline=None):
+        remaining = self.start()
+        board = board.copy()
+        counts = dict(counts)
+        root = self.tree.root(self.state_key(0, board, counts, remaining))
+        control = self.control
+        if control is not None and iterations is not None:
+            control.moves_total = iterations
+
+        best = None
+        best_score = None
+        done = 0
+        while iterations is None or done < iterations:
+            if deadline is not None and time.monotonic() >= deadline:
+                self.timed_out = True
+                break
+            if control is not None:
+                control.nodes = self.nodes
+                if control.cancelled:
+                    self.aborted = True
+                    break
+            result = self.playout(root, board, counts, remaining)
+            self.nodes += 1
+            done += 1
+            if control is not None and iterations is not None:
+                control.moves_done = done
+            steps, value, potential, finish = result
+            score = value + potential
+            if best is None or steps < best[0] or (steps == best[0] and score > best_score):
+                best = result
+                best_score = score
+        self.record()
+        return self.plan(best, remaining)
+
+
+def search_mcts(board, counts, pieces, objective, indexes, top_k, tree,
+                iterations=None, time_budget_ms=None, control=None, stats=None):
+    """
+    Best plan of MCTS playouts as (steps, score, placements), like search_plan.
+    Runs for iterations playouts or until time_budget_ms has passed, whichever
+    is given (both: whichever ends first). tree keeps statistics across calls;
+    stats, a SearchStats, collects the counters of this call.
+    """
+    if iterations is None and time_budget_ms is None:
+        raise ValueError("search_mcts needs iterations or time_budget_ms")
+    deadline = None
+    if time_budget_ms is not None:
+        deadline = time.monotonic() + time_budget_ms / 1000.0
+    start = time.perf_counter()
+    search = MCTSSearch(objective, pieces, indexes, top_k, tree, control, stats)
+    best = search.run_mcts(board, counts, iterations, deadline)
+    if stats is not None:
+        stats.total_time += time.perf_counter() - start
+    return best
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent plan cache for the block puzzle solvers (SQLite).
+
+Plans are keyed by a hash of the solver name, its configuration, the board,
+the cleared counts and the pieces as a sorted multiset, so the same puzzle
+with its pieces in another order is a hit; the plan's piece numbers are
+stored for the sorted order and mapped back to the caller's order.
+
+The configuration is a fingerprint of the solver module's upper-case
+constants (scoring weights, search parameters). When a solver's fingerprint
+differs from the one stored, its entries are dropped, so changing a scoring
+constant invalidates the cache on the next use. Per-call settings such as the
+search mode and beam width are a variant: part of each entry's key, so plans
+of different modes live side by side. The table holds at most max_entries
+plans; the least recently used go first. A stored plan that does not fit the
+pieces (a damaged file, an old format) is dropped and counts as a miss.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from bitboard import CLEAR_COLORS, piece_masks
+from search import counts_key, piece_key
+
+# ---------------- CONFIG ----------------
+PLAN_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.block_puzzle_plans.sqlite')
+PLAN_CACHE_MAX_ENTRIES = 20000
+# Bump when search or scoring code changes in a way the constants do not show
+PLAN_CACHE_VERSION = 5
+# Settings that never change the plan, or that are passed in explicitly
+CONFIG_IGNORED = ('SOLVER_WORKERS', 'SOLVE_TIME_BUDGET_MS', 'SOLVER_MODE', 'BEAM_WIDTH',
+                  'EXACT_MAX_NODES', 'WARM_START')
+
+
+def config_fingerprint(namespace, **extra):
+    """Hash of the upper-case constants of a module namespace and extra settings."""
+    config = {'version': PLAN_CACHE_VERSION}
+    for name, value in namespace.items():
+        if name.isupper() and name not in CONFIG_IGNORED and not name.startswith('_'):
+            try:
+                config[name] = json.loads(json.dumps(value))
+            except (TypeError, ValueError):
+                continue
+    config.update(extra)
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _canonical_order(pieces):
+    # Piece indices in sorted-multiset order; identical pieces keep their order
+    return sorted(range(len(pieces)), key=lambda i: piece_key(pieces[i]))
+
+def _decode_plan(text, pieces):
+    # A stored plan in the caller's piece order, or None unless every step
+    # uses another of the pieces, on the board, with sane cleared counts
+    try:
+        stored = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(stored, list):
+        return None
+    order = _canonical_order(pieces)
+    used = set()
+    plan = []
+    for step in stored:
+        if not isinstance(step, list) or len(step) != 3:
+            return None
+        pos, at, cleared = step
+        if type(pos) is not int or not 0 <= pos < len(order) or pos in used:
+            return None
+        used.add(pos)
+        idx = order[pos]
+        if at is not None:
+            if (not isinstance(at, list) or len(at) != 2 or
+                    any(type(v) is not int for v in at) or
+                    piece_masks(pieces[idx], *at) is None):
+                return None
+            at = tuple(at)
+        if (not isinstance(cleared, dict) or
+                any(col not in CLEAR_COLORS or type(n) is not int or n < 0
+                    for col, n in cleared.items())):
+            return None
+        plan.append((idx, at, cleared))
+    return plan
+
+
+class PlanCache:
+    """
+    Plans of suggest_best_sequence by puzzle state. Safe to share between the
+    UI thread and a background solve; every process opens its own connection.
+    """
+
+    def __init__(self, path=PLAN_CACHE_FILE, max_entries=PLAN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.checked = {}
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS plans ('
+                            'key TEXT PRIMARY KEY, solver TEXT NOT NULL, '
+                            'plan TEXT NOT NULL, used INTEGER NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS plans_used ON plans (used)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS configs ('
+                            'solver TEXT PRIMARY KEY, config TEXT NOT NULL)')
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM plans').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM plans')
+
+    def key(self, solver, config, board, counts, pieces, variant=None):
+        order = _canonical_order(pieces)
+        state = [solver, config, variant, list(board.key()), list(counts_key(counts)),
+                 [list(piece_key(pieces[i])) for i in order]]
+        text = json.dumps(state, separators=(',', ':'), sort_keys=True)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def check_config(self, solver, config):
+        # Drop a solver's plans once its configuration changed
+        if self.checked.get(solver) == config:
+            return
+        row = self.db.execute('SELECT config FROM configs WHERE solver = ?', (solver,)).fetchone()
+        if row is None or row[0] != config:
+            with self.db:
+                self.db.execute('DELETE FROM plans WHERE solver = ?', (solver,))
+                self.db.execute('INSERT OR REPLACE INTO configs (solver, config) VALUES (?, ?)',
+                                (solver, config))
+        self.checked[solver] = config
+
+    def get(self, solver, config, board, counts, pieces, variant=None):
+        """The cached plan in the caller's piece order, or None."""
+        key = self.key(solver, config, board, counts, pieces, variant)
+        with self.lock:
+            self.check_config(solver, config)
+            row = self.db.execute('SELECT plan FROM plans WHERE key = ?', (key,)).fetchone()
+            plan = None if row is None else _decode_plan(row[0], pieces)
+            if plan is None:
+                if row is not None:
+                    with self.db:
+                        self.db.execute('DELETE FROM plans WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            with self.db:
+                self.db.execute('UPDATE plans SET used = ? WHERE key = ?', (time.time_ns(), key))
+            self.hits += 1
+        return plan
+
+    def put(self, solver, config, board, counts, pieces, plan, variant=None):
+        order = _canonical_order(pieces)
+        canon = {idx: pos for pos, idx in enumerate(order)}
+        stored = [(canon[idx], at, cleared) for idx, at, cleared in plan]
+        key = self.key(solver, config, board, counts, pieces, variant)
+        with self.lock:
+            self.check_config(solver, config)
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO plans (key, solver, plan, used) '
+                                'VALUES (?, ?, ?, ?)',
+                                (key, solver, json.dumps(stored), time.time_ns()))
+                excess = (self.db.execute('SELECT COUNT(*) FROM plans').fetchone()[0] -
+                          self.max_entries)
+                if excess > 0:
+                    self.db.execute('DELETE FROM plans WHERE key IN '
+                                    '(SELECT key FROM plans ORDER BY used LIMIT ?)', (excess,))
+
+
+def open_plan_cache(path=PLAN_CACHE_FILE, max_entries=PLAN_CACHE_MAX_ENTRIES):
+    # None if the cache file cannot be opened; solving then works uncached
+    try:
+        return PlanCache(path, max_entries)
+    except sqlite3.Error:
+        return None
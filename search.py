@@ -0,0 +1,1213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared plan search for the 8x8 block puzzle solvers.
+
+Each solver module keeps its own scoring and plugs it in through an Objective;
+the search compares finished plans by (steps to goal, score): fewer steps
+first, then the higher score.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+
+from bitboard import Piece
+
+# ---------------- CONFIG ----------------
+TT_MAX_ENTRIES = 100000
+# Candidates kept per node in successive anytime rounds; the last round uses top_k
+ANYTIME_WIDTHS = (1, 2, 4, 8, 16)
+# Piece multisets whose plan steps a WarmStart remembers
+WARM_MAX_PLANS = 256
+
+
+# ---------------- Objective ----------------
+class Objective:
+    """
+    Scoring hooks of one solver variant.
+
+    candidates(board, piece, index)   -> [(r, c, occ_mask, color_masks)] for Board.make
+    score_candidate(piece, r, c, cleared, cleared_lines, board_after, counts_before)
+    placement_value(counts_before, cleared) -> integral score of one placement
+    plan_bonus(counts)                -> integral score of the final counts
+    goal_reached(counts)              -> True once the step goal is met
+    complete(counts)                  -> optional: True once no placement can add to
+                                         the plan any more; later pieces are left out
+    settled(counts)                   -> optional: True once goal_reached holds and
+                                         later pieces can only nudge the score; the
+                                         search stops branching there (tail)
+    live_cells(board, pieces)         -> optional mask of the cells that can still
+                                         be part of a clear with pieces; placements
+                                         outside it are hopeless
+    potential(board)                  -> score of the final board
+    steps_bound(board, counts, pieces) -> optional lower bound on placements of
+                                         pieces until goal_reached (inf if never);
+                                         it must never overestimate
+    top_candidates(board, piece, index, counts_before, k)
+                                      -> optional batch path: (top, n) with top the
+                                         k best candidates as (r, c, occ_mask,
+                                         color_masks, cleared, cleared_lines), best
+                                         first and ranked exactly like
+                                         score_candidate, and n the number of
+                                         candidates scored; or None to use the
+                                         per-candidate path
+    """
+    __slots__ = ('candidates', 'score_candidate', 'placement_value',
+                 'plan_bonus', 'goal_reached', 'potential', 'steps_bound', 'top_candidates',
+                 'complete', 'live_cells', 'settled')
+
+    def __init__(self, candidates, score_candidate, placement_value,
+                 plan_bonus, goal_reached, potential, steps_bound=None, top_candidates=None,
+                 complete=None, live_cells=None, settled=None):
+        self.candidates = candidates
+        self.score_candidate = score_candidate
+        self.placement_value = placement_value
+        self.plan_bonus = plan_bonus
+        self.goal_reached = goal_reached
+        self.potential = potential
+        self.steps_bound = steps_bound
+        self.top_candidates = top_candidates
+        self.complete = complete
+        self.live_cells = live_cells
+        self.settled = settled
+
+    def __reduce__(self):
+        return (Objective, (self.candidates, self.score_candidate, self.placement_value,
+                            self.plan_bonus, self.goal_reached, self.potential,
+                            self.steps_bound, self.top_candidates, self.complete,
+                            self.live_cells, self.settled))
+
+
+def counts_key(counts):
+    return (counts.get('yellow', 0), counts.get('green', 0), counts.get('red', 0))
+
+def piece_key(piece):
+    return piece.blocks if isinstance(piece, Piece) else tuple(piece)
+
+
+# ---------------- Transposition table ----------------
+class TranspositionTable:
+    """
+    Best finish found below each (board, counts, remaining pieces) state.
+
+    Bounded to max_entries; the least recently used entry is evicted first.
+    """
+
+    def __init__(self, max_entries=TT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        entries = self.entries
+        entries[key] = entry
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# ---------------- Warm start ----------------
+class WarmStart:
+    """
+    DFS state kept between calls on the same board and counts, e.g. while
+    pieces are added or deleted one at a time: the transposition table, and
+    the steps of the best plan found for each piece multiset. A plan for a
+    sub-multiset of the pieces still reaches the goal in as many steps with
+    the extra pieces placed after it, so search_warm starts from that step
+    limit instead of none. Another board, counts or search resets it.
+    """
+
+    def __init__(self, max_entries=TT_MAX_ENTRIES, max_plans=WARM_MAX_PLANS):
+        self.max_plans = max_plans
+        self.table = TranspositionTable(max_entries)
+        self.plans = OrderedDict()  # multiset key -> steps
+        self.context = None
+
+    def multiset(self, pieces):
+        groups = {}
+        for piece in pieces:
+            pid = piece_id(piece)
+            groups[pid] = groups.get(pid, 0) + 1
+        return tuple(sorted(groups.items()))
+
+    def begin(self, context, pieces):
+        """The table and step limit for a search of pieces in context."""
+        if context != self.context:
+            self.table.clear()
+            self.plans.clear()
+            self.context = context
+        have = dict(self.multiset(pieces))
+        limit = math.inf
+        for key, steps in self.plans.items():
+            if steps < limit and all(have.get(pid, 0) >= n for pid, n in key):
+                limit = steps
+        return self.table, limit
+
+    def record(self, pieces, best):
+        if best is None or best[0] == math.inf:
+            return
+        key = self.multiset(pieces)
+        self.plans[key] = min(best[0], self.plans.get(key, math.inf))
+        self.plans.move_to_end(key)
+        if len(self.plans) > self.max_plans:
+            self.plans.popitem(last=False)
+
+
+# ---------------- Search control ----------------
+class SearchControl:
+    """
+    Shared with a search running on another thread: cancel() stops it at the
+    next check, and the counters report progress. moves_total/moves_done count
+    the first moves of the plan; nodes lags by at most CONTROL_CHECK_NODES.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.moves_total = 0
+        self.moves_done = 0
+        self.nodes = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+
+CONTROL_CHECK_NODES = 64
+# Seconds between cancel checks while run_parallel waits for its workers
+CONTROL_POLL_S = 0.05
+
+
+# ---------------- Search statistics ----------------
+class SearchStats:
+    """
+    Counters and phase timings of a solve, filled in by the searches it is
+    passed to (added up over anytime rounds and worker processes):
+
+    nodes           nodes expanded
+    candidates      placements generated for the pieces of expanded nodes
+    pruned          candidates dropped by the top_k cut
+    hopeless        placements outside objective.live_cells (visited last by the
+                    DFS, dropped by the exact search)
+    leaves          finished plans evaluated
+    clears          placements whose line clears were computed
+    cuts            subtrees cut by objective.steps_bound
+    cap_hit         the node cap stopped a search
+    timed_out       the time budget stopped a search
+    candidate_time  seconds generating candidates
+    scoring_time    seconds scoring and ranking them (with batch scoring this
+                    includes generating them)
+    leaf_time       seconds evaluating finished plans
+    total_time      seconds for the whole solve
+    """
+    __slots__ = ('nodes', 'candidates', 'pruned', 'hopeless', 'leaves', 'clears', 'cuts',
+                 'cap_hit', 'timed_out', 'candidate_time', 'scoring_time', 'leaf_time',
+                 'total_time')
+
+    def __init__(self):
+        self.nodes = 0
+        self.candidates = 0
+        self.pruned = 0
+        self.hopeless = 0
+        self.leaves = 0
+        self.clears = 0
+        self.cuts = 0
+        self.cap_hit = False
+        self.timed_out = False
+        self.candidate_time = 0.0
+        self.scoring_time = 0.0
+        self.leaf_time = 0.0
+        self.total_time = 0.0
+
+    def merge(self, other):
+        for name in self.__slots__:
+            if name in ('cap_hit', 'timed_out'):
+                setattr(self, name, getattr(self, name) or getattr(other, name))
+            elif name != 'total_time':
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def summary(self):
+        stop = "node cap hit" if self.cap_hit else "time budget hit" if self.timed_out else "complete"
+        return (f"nodes {self.nodes:,}  leaves {self.leaves:,}  bound cuts {self.cuts:,}  ({stop})\n"
+                f"candidates {self.candidates:,}  pruned by top-k {self.pruned:,}  "
+                f"hopeless {self.hopeless:,}  clears {self.clears:,}\n"
+                f"time {self.total_time * 1000:.0f} ms: candidates "
+                f"{self.candidate_time * 1000:.0f}, scoring {self.scoring_time * 1000:.0f}, "
+                f"leaves {self.leaf_time * 1000:.0f}")
+
+
+# ---------------- Plan search ----------------
+# A finish below a state is (steps, value, potential, placements):
+#   steps      placements until goal_reached first holds (inf if never)
+#   value      integral score of those placements plus plan_bonus
+#   potential  objective.potential of the final board
+#   placements (pid, r, c, cleared, cleared_lines) with r None when skipped, as
+#              a persistent list (see chain)
+# steps and value are running totals, so a parent adds its move to the finish
+# of a child without walking the placements below it.
+NO_CLEAR = {'yellow': 0, 'green': 0, 'red': 0}
+
+def chain(items):
+    # Persistent list: () or (first item, rest). Putting an item in front is
+    # O(1) and shares the rest, so finishes of sibling moves, table entries
+    # and plans share their common tails instead of copying them
+    links = ()
+    for item in reversed(items):
+        links = (item, links)
+    return links
+
+def unchain(links):
+    items = []
+    while links:
+        item, links = links
+        items.append(item)
+    return items
+
+_PIECE_IDS = {}
+
+def piece_id(piece):
+    key = piece_key(piece)
+    pid = _PIECE_IDS.get(key)
+    if pid is None:
+        pid = _PIECE_IDS[key] = len(_PIECE_IDS)
+    return pid
+
+def distinct_orders(pieces):
+    # Number of piece orders once identical pieces are interchangeable
+    n = math.factorial(len(pieces))
+    groups = {}
+    for piece in pieces:
+        pid = piece_id(piece)
+        groups[pid] = groups.get(pid, 0) + 1
+    for k in groups.values():
+        n //= math.factorial(k)
+    return n
+
+
+class PlanSearch:
+    """
+    Depth-first search over (next piece, placement). Identical pieces form one
+    group that is expanded once per node; with perm given the order is fixed.
+    Equal (steps, score) plans are settled by the piece index sequence, then
+    visit order, which is what the old per-permutation enumeration picked.
+    A deadline (time.monotonic) stops the search like the node cap does, and
+    best_first visits the strongest candidates first. A SearchStats, when
+    given, collects counters and phase timings.
+
+    Branch and bound: each node gets a step limit, the most steps a finish
+    below it may take and still tie the best plan known above it. Subtrees
+    whose objective.steps_bound exceeds the limit are cut; the bound never
+    overestimates, so the chosen plan is the same as without cuts. Results
+    of subtrees that saw a cut are not exact and stay out of the table.
+
+    Below a state where objective.settled holds the steps are fixed and the
+    score can only change a little, so the search stops branching there and
+    finishes the plan with tail(). Below other states where the goal holds,
+    such as one color done of two, the search keeps going for the score.
+
+    One board and one counts dict are updated in place along the current
+    path: moves are applied with Board.make and reverted from the undo record
+    and the cleared counts when the search backs out.
+    """
+
+    def __init__(self, objective, pieces, indexes, top_k, max_nodes, table=None, perm=None,
+                 control=None, deadline=None, best_first=False, stats=None):
+        self.objective = objective
+        self.top_k = top_k
+        self.max_nodes = max_nodes
+        self.table = table
+        self.perm = perm
+        self.pieces = pieces
+        self.indexes = indexes
+
+        self.groups = {}
+        self.group_pieces = {}
+        self.group_indexes = {}
+        for i, piece in enumerate(pieces):
+            pid = piece_id(piece)
+            if pid not in self.groups:
+                self.groups[pid] = []
+                self.group_pieces[pid] = piece
+                self.group_indexes[pid] = indexes[i]
+            self.groups[pid].append(i)
+        self.pids = list(self.groups)
+        self.rank = {pid: j for j, pid in enumerate(self.pids)}
+        self.key_slots = sorted(range(len(self.pids)), key=lambda j: self.pids[j])
+        self.order = None if perm is None else tuple(piece_id(pieces[i]) for i in perm)
+        self.total = len(pieces)
+
+        self.control = control
+        self.deadline = deadline
+        self.best_first = best_first
+        self.stats = stats
+        self.nodes = 0
+        self.cuts = 0
+        self.aborted = False
+        self.timed_out = False
+
+    def start(self):
+        return tuple(len(self.groups[pid]) for pid in self.pids)
+
+    def run(self, board, counts, limit=math.inf):
+        remaining = self.start()
+        board = board.copy()
+        counts = dict(counts)
+        best = self.expand(0, board, counts, 0.0, remaining, limit)
+        self.record()
+        return self.plan(best, remaining)
+
+    def record(self):
+        # Add the counters of this search to stats
+        stats = self.stats
+        if stats is None:
+            return
+        stats.nodes += self.nodes
+        stats.cuts += self.cuts
+        stats.cap_hit = stats.cap_hit or self.nodes > self.max_nodes
+        stats.timed_out = stats.timed_out or self.timed_out
+
+    def run_greedy(self, board, counts):
+        """
+        A single rollout: each step takes the best placement of every
+        remaining piece and places the one that ranks best like in the beam
+        search (goal first, then value + plan_bonus + potential). It takes
+        one node per piece, so a plan exists however short the time budget.
+        """
+        remaining = self.start()
+        objective = self.objective
+        board = board.copy()
+        counts = dict(counts)
+        rest = remaining
+        steps = math.inf
+        value = 0.0
+        finish = []
+        for step in range(self.total):
+            self.nodes += 1
+            best = None
+            best_rank = None
+            for move in self.children(step, board, counts, rest, 1):
+                undo = self.make(board, counts, move)
+                rank = (objective.goal_reached(counts),
+                        value + move[8] + objective.plan_bonus(counts) + objective.potential(board))
+                self.unmake(board, counts, move, undo)
+                if best is None or rank > best_rank:
+                    best = move
+                    best_rank = rank
+            self.make(board, counts, best)
+            value += best[8]
+            rest = best[1]
+            finish.append((best[0], best[2], best[3], best[4], best[5]))
+            if steps == math.inf and objective.goal_reached(counts):
+                steps = step + 1
+
+        _, bonus, potential, _ = self.leaf(board, counts)
+        self.record()
+        return self.plan((steps, value + bonus, potential, chain(finish)), remaining)
+
+    def run_beam(self, board, counts, width):
+        """
+        Beam search: only the width best partial plans survive each depth, so
+        the work grows with the number of pieces instead of the number of
+        orders. Partial plans rank like finished ones, by steps to goal and
+        then by value + plan_bonus + potential of the board so far; partial
+        plans that reach the same state keep only the best one.
+        """
+        remaining = self.start()
+        objective = self.objective
+        control = self.control
+        if control is not None:
+            control.moves_total = self.total
+
+        # (board, counts, remaining, steps, value, finish)
+        beam = [(board.copy(), dict(counts), remaining, math.inf, 0.0, ())]
+        for step in range(self.total):
+            ranked = []
+            for parent, (b, cnt, rem, steps, value, _) in enumerate(beam):
+                self.nodes += 1
+                if control is not None:
+                    control.nodes = self.nodes
+                    if control.cancelled:
+                        self.aborted = True
+                        self.record()
+                        return None
+                for move in self.children(step, b, cnt, rem):
+                    undo = self.make(b, cnt, move)
+                    if steps == math.inf and objective.goal_reached(cnt):
+                        reached = step + 1
+                    else:
+                        reached = steps
+                    v = value + move[8]
+                    score = v + objective.plan_bonus(cnt) + objective.potential(b)
+                    key = self.state_key(step + 1, b, cnt, move[1])
+                    ranked.append((reached, -score, len(ranked), key, parent, move, v))
+                    self.unmake(b, cnt, move, undo)
+            ranked.sort(key=lambda x: x[:3])
+
+            next_beam = []
+            seen = set()
+            for reached, _, _, key, parent, move, v in ranked:
+                if key in seen:
+                    continue
+                seen.add(key)
+                b, cnt, _, _, _, finish = beam[parent]
+                b = b.copy()
+                cnt = dict(cnt)
+                self.make(b, cnt, move)
+                # Partial plans are built last placement first
+                pl = (move[0], move[2], move[3], move[4], move[5])
+                next_beam.append((b, cnt, move[1], reached, v, (pl, finish)))
+                if len(next_beam) >= width:
+                    break
+            beam = next_beam
+            if control is not None:
+                control.moves_done = step + 1
+
+        best = None
+        best_score = None
+        for b, cnt, _, steps, value, finish in beam:
+            _, bonus, potential, _ = self.leaf(b, cnt)
+            value += bonus
+            score = value + potential
+            if best is None or steps < best[0] or (steps == best[0] and score > best_score):
+                best = (steps, value, potential, finish)
+                best_score = score
+        if best is not None:
+            best = best[:3] + (chain(unchain(best[3])[::-1]),)
+        self.record()
+        return self.plan(best, remaining)
+
+    def run_parallel(self, board, counts, workers):
+        # Each root child is searched in a worker with an even share of the
+        # node budget; results are reduced in serial visit order, so the
+        # chosen plan does not depend on scheduling.
+        remaining = self.start()
+        self.nodes += 1
+        board = board.copy()
+        counts = dict(counts)
+        children = self.children(0, board, counts, remaining)
+        tasks = []
+        for child in children:
+            undo = self.make(board, counts, child)
+            tasks.append((child[1], board.copy(), dict(counts), child[8],
+                          self.objective.goal_reached(counts)))
+            self.unmake(board, counts, child, undo)
+        budget = max(1, (self.max_nodes - 1) // len(children))
+        control = self.control
+        if control is not None:
+            control.moves_total = len(children)
+        table_size = self.table.max_entries if self.table is not None else TT_MAX_ENTRIES
+        import multiprocessing
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        # Set on cancel; the workers' searches check it like a SearchControl
+        cancel = multiprocessing.Event()
+        initargs = (self.objective, self.pieces, self.indexes, self.top_k, budget,
+                    self.perm, table_size, self.stats is not None, cancel)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            futures = [pool.submit(_expand_child, *task[:4]) for task in tasks]
+            pending = set(futures)
+            timeout = CONTROL_POLL_S if control is not None else None
+            while pending:
+                done, pending = wait(pending, timeout, FIRST_COMPLETED)
+                if control is not None:
+                    control.moves_done += len(done)
+                    if control.cancelled:
+                        cancel.set()
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        self.aborted = True
+                        self.record()
+                        return None
+            subs = []
+            for f in futures:
+                sub, stats = f.result()
+                subs.append(sub)
+                if stats is not None:
+                    self.stats.merge(stats)
+
+        best = None
+        best_score = None
+        for child, task, sub in zip(children, tasks, subs):
+            if sub is not None:
+                best, best_score = self.combine(best, best_score, child, sub, 0.0, remaining,
+                                                task[4])
+        self.record()
+        return self.plan(best, remaining)
+
+    def plan(self, best, remaining):
+        if best is None:
+            return None
+        steps, value, potential, finish = best
+        finish = unchain(finish)
+
+        if self.perm is not None:
+            seq = self.perm
+        else:
+            seq = self.indices(finish, remaining)
+        placements = []
+        for idx, (pid, r, c, cleared, cleared_lines) in zip(seq, finish):
+            placements.append((idx, r, c, cleared, cleared_lines))
+        return (steps, value + potential, placements)
+
+    def indices(self, finish, remaining):
+        # Identical pieces are used lowest index first
+        used = [len(self.groups[pid]) - n for pid, n in zip(self.pids, remaining)]
+        seq = []
+        for pl in finish:
+            pid = pl[0]
+            j = self.rank[pid]
+            seq.append(self.groups[pid][used[j]])
+            used[j] += 1
+        return tuple(seq)
+
+    def precedes(self, a, b, remaining):
+        # indices(unchain(a), remaining) < indices(unchain(b), remaining),
+        # walking the two finishes only up to their first difference
+        used_a = [len(self.groups[pid]) - n for pid, n in zip(self.pids, remaining)]
+        used_b = list(used_a)
+        rank = self.rank
+        groups = self.groups
+        while a and b:
+            if a is b:
+                return False
+            (pa, a), (pb, b) = a, b
+            ja = rank[pa[0]]
+            jb = rank[pb[0]]
+            ia = groups[pa[0]][used_a[ja]]
+            ib = groups[pb[0]][used_b[jb]]
+            if ia != ib:
+                return ia < ib
+            used_a[ja] += 1
+            used_b[jb] += 1
+        return bool(b)
+
+    def pieces_left(self, step, remaining):
+        if self.order is not None:
+            return [self.group_pieces[pid] for pid in self.order[step:]]
+        pieces = []
+        for pid, n in zip(self.pids, remaining):
+            pieces.extend([self.group_pieces[pid]] * n)
+        return pieces
+
+    def state_key(self, step, board, counts, remaining):
+        if self.order is not None:
+            rest = self.order[step:]
+        else:
+            pids = self.pids
+            rest = tuple((pids[j], remaining[j]) for j in self.key_slots if remaining[j])
+        return (board.key(), counts_key(counts), rest)
+
+    def children(self, step, board, counts, remaining, k=None):
+        """
+        Moves out of a node in visit order, as
+        (pid, rest, r, c, cleared, cleared_lines, occ_mask, color_masks, value)
+        with occ_mask None when the piece has no placement, from the k (default
+        top_k) best placements of each piece. board is scored in place and
+        left as it was. Placements outside objective.live_cells can still be
+        the best move, since they clear nothing and so risk no overkill, so
+        they are kept but visited after every other move.
+        """
+        objective = self.objective
+        if self.order is not None:
+            slots = [self.rank[self.order[step]]]
+        else:
+            slots = [j for j, n in enumerate(remaining) if n]
+
+        live = None
+        moves = []
+        later = []
+        for j in slots:
+            pid = self.pids[j]
+            piece = self.group_pieces[pid]
+            rest = remaining[:j] + (remaining[j] - 1,) + remaining[j + 1:]
+            top = self.top_candidates(board, counts, pid, self.top_k if k is None else k)
+            hopeless = []
+            if len(top) > 1 and objective.live_cells is not None:
+                if live is None:
+                    live = objective.live_cells(board, self.pieces_left(step, remaining))
+                useful = [cand for cand in top if cand[2] & live]
+                if useful and len(useful) < len(top):
+                    hopeless = [cand for cand in top if not cand[2] & live]
+                    if self.stats is not None:
+                        self.stats.hopeless += len(hopeless)
+                    top = useful
+
+            if not top:
+                top = [(None, None, None, None, NO_CLEAR, [])]
+            elif not self.best_first:
+                # Visit the weakest of the top candidates first, like the old explicit stack
+                top.reverse()
+                hopeless.reverse()
+
+            for out, cands in ((moves, top), (later, hopeless)):
+                for r, c, occ_mask, color_masks, cleared, cleared_lines in cands:
+                    value = objective.placement_value(counts, cleared)
+                    out.append((pid, rest, r, c, cleared, cleared_lines, occ_mask, color_masks,
+                                value))
+        return moves + later
+
+    def top_candidates(self, board, counts, pid, k):
+        # The k best placements of a piece, best first, as
+        # (r, c, occ_mask, color_masks, cleared, cleared_lines)
+        objective = self.objective
+        piece = self.group_pieces[pid]
+        index = self.group_indexes[pid]
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+        if objective.top_candidates is not None:
+            batch = objective.top_candidates(board, piece, index, counts, k)
+            if batch is not None:
+                top, n = batch
+                if stats is not None:
+                    stats.scoring_time += time.perf_counter() - start
+                    stats.candidates += n
+                    stats.pruned += n - len(top)
+                    stats.clears += n
+                return top
+
+        cands = objective.candidates(board, piece, index)
+        if stats is not None:
+            now = time.perf_counter()
+            stats.candidate_time += now - start
+            start = now
+        scored = []
+        for r, c, occ_mask, color_masks in cands:
+            cleared, cleared_lines, undo = board.make(occ_mask, color_masks)
+            sc = objective.score_candidate(piece, r, c, cleared, cleared_lines, board, counts)
+            board.unmake(undo)
+            scored.append((sc, (r, c, occ_mask, color_masks, cleared, cleared_lines)))
+        scored.sort(reverse=True, key=lambda x: x[0])
+        top = [cand for _, cand in scored[:k]]
+        if stats is not None:
+            stats.scoring_time += time.perf_counter() - start
+            stats.candidates += len(cands)
+            stats.pruned += len(cands) - len(top)
+            stats.clears += len(cands)
+        return top
+
+    def leaf(self, board, counts):
+        # Finish of a plan with no pieces left
+        objective = self.objective
+        stats = self.stats
+        if stats is None:
+            return (math.inf, objective.plan_bonus(counts), objective.potential(board), ())
+        start = time.perf_counter()
+        finish = (math.inf, objective.plan_bonus(counts), objective.potential(board), ())
+        stats.leaf_time += time.perf_counter() - start
+        stats.leaves += 1
+        return finish
+
+    def tail(self, step, board, counts, remaining):
+        """
+        Finish of a state where objective.settled holds. Only the score can
+        still change, and only a little, so instead of a search each step
+        takes the best placement of every remaining piece and places the one
+        worth most (placement_value; ties go to the first in visit order).
+        Once objective.complete holds the remaining pieces are left out.
+        """
+        objective = self.objective
+        complete = objective.complete
+        applied = []
+        placements = []
+        value = 0.0
+        while step < self.total:
+            if complete is not None and complete(counts):
+                break
+            best = None
+            for move in self.children(step, board, counts, remaining, 1):
+                if best is None or move[8] > best[8]:
+                    best = move
+            applied.append((best, self.make(board, counts, best)))
+            placements.append((best[0], best[2], best[3], best[4], best[5]))
+            value += best[8]
+            remaining = best[1]
+            step += 1
+
+        _, bonus, potential, _ = self.leaf(board, counts)
+        for move, undo in reversed(applied):
+            self.unmake(board, counts, move, undo)
+        return (math.inf, value + bonus, potential, chain(placements))
+
+    def make(self, board, counts, move):
+        # Apply move in place; the returned undo record and the move's cleared
+        # counts revert it in unmake
+        undo = None if move[6] is None else board.make(move[6], move[7])[2]
+        if undo is not None and self.stats is not None:
+            self.stats.clears += 1
+        cleared = move[4]
+        for col in cleared:
+            counts[col] = counts.get(col, 0) + cleared[col]
+        return undo
+
+    def unmake(self, board, counts, move, undo):
+        if undo is not None:
+            board.unmake(undo)
+        cleared = move[4]
+        for col in cleared:
+            counts[col] -= cleared[col]
+
+    def combine(self, best, best_score, move, sub, prefix, remaining, reached):
+        # Fold the finish below one move into the best finish of its parent;
+        # reached tells whether the move itself met the goal
+        pid, _, r, c, cleared, cleared_lines, _, _, value = move
+        sub_steps, sub_value, potential, finish = sub
+        steps = 1 if reached else 1 + sub_steps
+        value += sub_value
+        score = (prefix + value) + potential
+        finish = ((pid, r, c, cleared, cleared_lines), finish)
+        if (best is None or steps < best[0] or
+                (steps == best[0] and (score > best_score or
+                 (score == best_score and self.precedes(finish, best[3], remaining))))):
+            return (steps, value, potential, finish), score
+        return best, best_score
+
+    def expand(self, step, board, counts, prefix, remaining, limit=math.inf):
+        # limit is finite only below moves that left the goal unmet
+        if limit < math.inf:
+            bound = self.objective.steps_bound
+            if bound is not None and bound(board, counts, self.pieces_left(step, remaining)) > limit:
+                self.cuts += 1
+                return None
+
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            self.aborted = True
+            return None
+
+        control = self.control
+        if not self.nodes % CONTROL_CHECK_NODES:
+            if control is not None:
+                control.nodes = self.nodes
+                if control.cancelled:
+                    self.aborted = True
+                    return None
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.aborted = True
+                self.timed_out = True
+                return None
+
+        if step >= self.total:
+            return self.leaf(board, counts)
+        settled = self.objective.settled
+        if settled is not None and settled(counts):
+            return self.tail(step, board, counts, remaining)
+
+        table = self.table
+        if table is not None:
+            key = self.state_key(step, board, counts, remaining)
+            hit = table.get(key)
+            if hit is not None:
+                return hit
+
+        moves = self.children(step, board, counts, remaining)
+        at_root = step == 0 and control is not None
+        if at_root:
+            control.moves_total = len(moves)
+
+        best = None
+        best_score = None
+        cuts = self.cuts
+        goal_reached = self.objective.goal_reached
+        for move in moves:
+            undo = self.make(board, counts, move)
+            reached = goal_reached(counts)
+            if reached:
+                # Steps are fixed at 1; below, only the score is searched
+                sub_limit = math.inf
+            elif best is None:
+                sub_limit = limit - 1
+            else:
+                sub_limit = min(limit, best[0]) - 1
+            sub = self.expand(step + 1, board, counts, prefix + move[8], move[1], sub_limit)
+            self.unmake(board, counts, move, undo)
+            if sub is not None:
+                best, best_score = self.combine(best, best_score, move, sub, prefix, remaining,
+                                                reached)
+            if self.aborted:
+                return best
+            if at_root:
+                control.moves_done += 1
+                control.nodes = self.nodes
+
+        if table is not None and best is not None and self.cuts == cuts:
+            table.put(key, best)
+        return best
+
+
+# ---------------- Process pool ----------------
+_WORKER_SEARCH = None
+
+class _WorkerControl:
+    # Stands in for the SearchControl in a worker: cancelled mirrors the
+    # multiprocessing.Event that run_parallel sets on cancel
+    def __init__(self, event):
+        self.event = event
+        self.moves_total = 0
+        self.moves_done = 0
+        self.nodes = 0
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+def _init_worker(objective, pieces, indexes, top_k, max_nodes, perm, table_size, with_stats,
+                 cancel):
+    global _WORKER_SEARCH
+    _WORKER_SEARCH = (objective, pieces, indexes, top_k, max_nodes, perm,
+                      TranspositionTable(table_size), with_stats, _WorkerControl(cancel))
+
+def _expand_child(rest, board, counts, prefix):
+    # The worker's table outlives single tasks, so later children reuse it.
+    # Returns the child's finish and its SearchStats (None unless collected)
+    (objective, pieces, indexes, top_k, max_nodes, perm, table, with_stats,
+     control) = _WORKER_SEARCH
+    stats = SearchStats() if with_stats else None
+    search = PlanSearch(objective, pieces, indexes, top_k, max_nodes, table, perm, control,
+                        stats=stats)
+    sub = search.expand(1, board, counts, prefix, rest)
+    search.record()
+    return sub, stats
+
+def resolve_workers(workers):
+    # 0 means one worker per core; never more workers than cores
+    cores = os.cpu_count() or 1
+    if workers is None:
+        workers = 1
+    if workers <= 0:
+        workers = cores
+    return max(1, min(workers, cores))
+
+
+# ---------------- Anytime search ----------------
+def search_anytime(board, counts, pieces, objective, indexes, top_k, time_budget_ms,
+                   perm=None, control=None, stats=None):
+    """
+    Search under a wall-clock budget instead of a node cap. A greedy rollout
+    (run_greedy, one node per piece) is always completed first; the time left
+    goes to full searches keeping more of the best-scored candidates per node
+    (ANYTIME_WIDTHS, then top_k), strongest first, each stopped by the
+    deadline. The best plan of any round is returned.
+    """
+    deadline = time.monotonic() + time_budget_ms / 1000.0
+    widths = [w for w in ANYTIME_WIDTHS if w < top_k] + [top_k]
+
+    best = PlanSearch(objective, pieces, indexes, 1, math.inf, None, perm, control,
+                      stats=stats).run_greedy(board, counts)
+    if control is not None:
+        control.moves_done = 0
+    for width in widths:
+        if time.monotonic() >= deadline or (control is not None and control.cancelled):
+            break
+        search = PlanSearch(objective, pieces, indexes, width, math.inf, TranspositionTable(),
+                            perm, control, deadline=deadline, best_first=True, stats=stats)
+        plan = search.run(board, counts)
+        if plan is not None and (best is None or plan[0] < best[0] or
+                                 (plan[0] == best[0] and plan[1] > best[1])):
+            best = plan
+        if search.aborted or time.monotonic() >= deadline:
+            break
+        if control is not None:
+            control.moves_done = 0
+    return best
+
+
+# ---------------- Exact search ----------------
+class Certificate:
+    """
+    What the exact search proved. steps is the fewest placements that reach
+    objective.goal_reached (inf: the pieces can never reach it); proven means
+    every shorter plan was searched with no cut but the admissible
+    objective.steps_bound. An interrupted search leaves proven False, and
+    lower_bound is then the fewest placements a plan can still need.
+    """
+    __slots__ = ('steps', 'proven', 'lower_bound', 'limits', 'nodes')
+
+    def __init__(self):
+        self.steps = math.inf
+        self.proven = False
+        self.lower_bound = 0
+        self.limits = []    # depth limits searched to exhaustion
+        self.nodes = 0
+
+    def as_dict(self):
+        # JSON friendly: an unreachable goal is steps None
+        d = {name: getattr(self, name) for name in self.__slots__}
+        for name in ('steps', 'lower_bound'):
+            if d[name] == math.inf:
+                d[name] = None
+        d['limits'] = list(self.limits)
+        return d
+
+
+class ExactSearch(PlanSearch):
+    """
+    IDA* for the fewest placements until objective.goal_reached. Every
+    placement of every remaining piece is a move (no top_k cut, and pieces
+    may stay unplaced); objective.steps_bound is the heuristic. States shown
+    to need more than some number of placements are remembered across
+    iterations, so transpositions of the same placements are searched once.
+    """
+
+    def __init__(self, objective, pieces, indexes, top_k, max_nodes, control=None,
+                 deadline=None, stats=None):
+        super().__init__(objective, pieces, indexes, top_k, max_nodes, control=control,
+                         deadline=deadline, stats=stats)
+        self.failed = {}
+        self.next_limit = math.inf
+
+    def heuristic(self, step, board, counts, remaining):
+        if self.objective.goal_reached(counts):
+            return 0
+        bound = self.objective.steps_bound
+        if bound is None:
+            return 1
+        return max(1, bound(board, counts, self.pieces_left(step, remaining)))
+
+    def placements(self, board, counts, remaining):
+        # Every placement of every remaining piece, the ones clearing lines
+        # first; no scoring, the order only speeds up finding a plan.
+        # Placements outside objective.live_cells are dropped: leaving the
+        # piece out does at least as well, since their cells never clear
+        objective = self.objective
+        live = -1
+        if objective.live_cells is not None:
+            live = objective.live_cells(board, self.pieces_left(0, remaining))
+        clearing = []
+        others = []
+        for j, n in enumerate(remaining):
+            if not n:
+                continue
+            pid = self.pids[j]
+            rest = remaining[:j] + (n - 1,) + remaining[j + 1:]
+            for r, c, occ_mask, color_masks in objective.candidates(
+                    board, self.group_pieces[pid], self.group_indexes[pid]):
+                if not occ_mask & live:
+                    if self.stats is not None:
+                        self.stats.hopeless += 1
+                    continue
+                cleared, cleared_lines, undo = board.make(occ_mask, color_masks)
+                board.unmake(undo)
+                move = (pid, rest, r, c, cleared, cleared_lines, occ_mask, color_masks,
+                        objective.placement_value(counts, cleared))
+                (clearing if cleared_lines else others).append(move)
+        if self.stats is not None:
+            self.stats.candidates += len(clearing) + len(others)
+        return clearing + others
+
+    def probe(self, step, board, counts, remaining, budget):
+        # Moves reaching the goal within budget placements, or None
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            self.aborted = True
+            return None
+        if not self.nodes % CONTROL_CHECK_NODES:
+            control = self.control
+            if control is not None:
+                control.nodes = self.nodes
+                if control.cancelled:
+                    self.aborted = True
+                    return None
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.aborted = True
+                self.timed_out = True
+                return None
+
+        h = self.heuristic(step, board, counts, remaining)
+        if h > budget:
+            self.cuts += 1
+            self.next_limit = min(self.next_limit, step + h)
+            return None
+        key = self.state_key(step, board, counts, remaining)
+        if self.failed.get(key, -1) >= budget:
+            return None
+
+        goal_reached = self.objective.goal_reached
+        for move in self.placements(board, counts, remaining):
+            undo = self.make(board, counts, move)
+            if goal_reached(counts):
+                self.unmake(board, counts, move, undo)
+                return [move]
+            sub = self.probe(step + 1, board, counts, move[1], budget - 1)
+            self.unmake(board, counts, move, undo)
+            if sub is not None:
+                return [move] + sub
+            if self.aborted:
+                return None
+        self.failed[key] = budget
+        return None
+
+    def run_exact(self, board, counts, certificate):
+        """
+        The moves of a shortest plan to the goal ([] if it already holds), or
+        None when there is none or the search was interrupted.
+        """
+        remaining = self.start()
+        board = board.copy()
+        counts = dict(counts)
+        found = None
+        limit = self.heuristic(0, board, counts, remaining)
+        while limit <= self.total:
+            self.next_limit = math.inf
+            found = self.probe(0, board, counts, remaining, limit) if limit else []
+            if self.control is not None:
+                self.control.nodes = self.nodes
+            if found is not None or self.aborted:
+                break
+            certificate.limits.append(limit)
+            limit = self.next_limit
+        self.record()
+
+        certificate.nodes += self.nodes
+        if found is not None:
+            certificate.steps = len(found)
+        certificate.proven = not self.aborted
+        certificate.lower_bound = certificate.steps if certificate.proven else limit
+        return found
+
+
+def search_exact(board, counts, pieces, objective, indexes, top_k, max_nodes, beam_width,
+                 control=None, time_budget_ms=None, stats=None, certificate=None):
+    """
+    Plan with the fewest placements until the goal, as (steps, score,
+    placements) like search_plan, and a Certificate of it filled in. The
+    pieces the shortest plan leaves out follow in the order a top_k beam
+    search of beam_width picks. With no plan to the goal found, because there
+    is none or max_nodes or time_budget_ms ran out first, the beam search
+    plans every piece instead; certificate tells the two apart.
+    """
+    start = time.perf_counter()
+    if certificate is None:
+        certificate = Certificate()
+    deadline = None
+    if time_budget_ms is not None:
+        deadline = time.monotonic() + time_budget_ms / 1000.0
+    best = _search_exact(board, counts, pieces, objective, indexes, top_k, max_nodes,
+                         beam_width, control, deadline, stats, certificate)
+    if stats is not None:
+        stats.total_time += time.perf_counter() - start
+    return best
+
+def _search_exact(board, counts, pieces, objective, indexes, top_k, max_nodes, beam_width,
+                  control, deadline, stats, certificate):
+    exact = ExactSearch(objective, pieces, indexes, top_k, max_nodes, control, deadline, stats)
+    found = exact.run_exact(board, counts, certificate)
+    if found is None:
+        if control is not None and control.cancelled:
+            return None
+        return PlanSearch(objective, pieces, indexes, top_k, math.inf, control=control,
+                          stats=stats).run_beam(board, counts, beam_width)
+
+    remaining = exact.start()
+    board = board.copy()
+    counts = dict(counts)
+    value = 0.0
+    finish = []
+    for move in found:
+        exact.make(board, counts, move)
+        value += move[8]
+        finish.append((move[0], move[2], move[3], move[4], move[5]))
+    seq = list(exact.indices(finish, remaining))
+    placements = [(idx, r, c, cleared, cleared_lines)
+                  for idx, (_, r, c, cleared, cleared_lines) in zip(seq, finish)]
+
+    left = [i for i in range(len(pieces)) if i not in seq]
+    if left:
+        tail = PlanSearch(objective, [pieces[i] for i in left], [indexes[i] for i in left],
+                          top_k, math.inf, control=control,
+                          stats=stats).run_beam(board, counts, beam_width)
+        if tail is None:
+            return None
+        _, tail_score, tail_placements = tail
+        for idx, r, c, cleared, cleared_lines in tail_placements:
+            placements.append((left[idx], r, c, cleared, cleared_lines))
+    else:
+        tail_score = objective.plan_bonus(counts) + objective.potential(board)
+    return (len(found), value + tail_score, placements)
+
+
+def search_plan(board, counts, pieces, objective, indexes, top_k, max_nodes,
+                table=None, perm=None, workers=1, control=None, time_budget_ms=None,
+                beam_width=None, stats=None, limit=math.inf):
+    """
+    Best plan for placing pieces, as (steps, score, placements) with
+    placements [(idx, r, c, cleared, cleared_lines)], or None. Without perm the
+    search also picks the piece order. workers > 1 splits the root over a
+    process pool and falls back to the serial search if the pool cannot run.
+    A SearchControl can cancel the search and watch its progress. With
+    time_budget_ms the serial anytime search runs instead, and with beam_width
+    the beam search; neither uses max_nodes, table or workers. A SearchStats
+    passed as stats collects counters and timings of the solve. limit, the
+    steps of a plan known to exist, lets the serial search cut from the start;
+    plans with more steps may then be missed.
+    """
+    start = time.perf_counter()
+    best = _search_plan(board, counts, pieces, objective, indexes, top_k, max_nodes,
+                        table, perm, workers, control, time_budget_ms, beam_width, stats, limit)
+    if stats is not None:
+        stats.total_time += time.perf_counter() - start
+    return best
+
+def _search_plan(board, counts, pieces, objective, indexes, top_k, max_nodes,
+                 table, perm, workers, control, time_budget_ms, beam_width, stats, limit):
+    if beam_width is not None:
+        search = PlanSearch(objective, pieces, indexes, top_k, max_nodes, None, perm, control,
+                            stats=stats)
+        return search.run_beam(board, counts, beam_width)
+    if time_budget_ms is not None:
+        return search_anytime(board, counts, pieces, objective, indexes, top_k,
+                              time_budget_ms, perm, control, stats)
+    workers = resolve_workers(workers)
+    if workers > 1 and len(pieces) > 1:
+        # Imported here so serial searches do not load the process pool machinery
+        from concurrent.futures.process import BrokenProcessPool
+        search = PlanSearch(objective, pieces, indexes, top_k, max_nodes, table, perm, control,
+                            stats=stats)
+        try:
+            return search.run_parallel(board, counts, workers)
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            if control is not None:
+                control.moves_done = 0
+    search = PlanSearch(objective, pieces, indexes, top_k, max_nodes, table, perm, control,
+                        stats=stats)
+    return search.run(board, counts, limit)
+
+def search_warm(warm, board, counts, pieces, objective, indexes, top_k, max_nodes, workers=1,
+                control=None, stats=None):
+    """
+    search_plan (DFS, no time budget) with the table and step limit of a
+    WarmStart, which then remembers the result. Cuts under the limit never
+    drop a plan that ties it, so the plan is the one a cold search finds
+    unless the node cap differs; when this tree holds no plan within the
+    limit after all, the search runs again without it.
+    """
+    context = (board.key(), counts_key(counts), objective, top_k)
+    table, limit = warm.begin(context, pieces)
+    best = search_plan(board, counts, pieces, objective, indexes, top_k, max_nodes, table,
+                       workers=workers, control=control, stats=stats, limit=limit)
+    if control is not None and control.cancelled:
+        return best
+    if limit < math.inf and (best is None or best[0] > limit):
+        best = search_plan(board, counts, pieces, objective, indexes, top_k, max_nodes, table,
+                           workers=workers, control=control, stats=stats)
+    warm.record(pieces, best)
+    return best
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line solver: reads one puzzle as JSON and prints the plan as JSON.
+Only the *_core modules are imported, never tkinter.
+
+    python solve.py puzzle.json
+    python solve.py --solver solver7 --mode beam < puzzle.json
+    python solve.py --jsonl turns.jsonl --jobs 4 --ordered > plans.jsonl
+
+Puzzle:
+    {"board": "initial" or 8 rows of 8 colors / null,
+     "counts": {"yellow": 0, "green": 0, "red": 0},      (optional)
+     "pieces": [[[dy, dx, color], ...], ...]}
+
+Output:
+    {"plan": [{"piece": i, "row": r, "col": c, "cleared": {...}}, ...] or null,
+     "stats": {...},                                     (with --stats)
+     "certificate": {"steps": n, "proven": true, ...}}   (with --mode exact)
+
+--mode exact finds the fewest placements that reach the solver's goal and
+proves it: "steps" (null: unreachable) is minimal when "proven" is true, and
+otherwise no plan needs fewer than "lower_bound" placements.
+
+--cache FILE keeps plans in a PlanCache (plan_cache.py) across runs.
+
+Piece numbers, rows and columns are 0-based; row and col are null for a piece
+that cannot be placed, and pieces still left once every target is met are not
+in the plan. Pieces are normalized (shifted to row/column 0) like the
+piece editor does, and row/col are where the normalized piece's (0, 0) goes.
+
+With --jsonl the input has one puzzle per line and the output one result per
+line, written as soon as it is solved, with "line" (1-based input line), the
+puzzle's "id" if it has one, and "error" instead of "plan" for a bad line.
+Puzzles are solved on --jobs processes with at most --window of them read
+ahead, so memory stays flat however long the input is; --ordered keeps the
+output in input order.
+"""
+
+import argparse
+import importlib
+import json
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from bitboard import BOARD_SIZE, COLORS, Board, Piece
+from plan_cache import PlanCache
+from search import Certificate, SearchStats, resolve_workers
+
+# ---------------- CONFIG ----------------
+SOLVERS = {'solver9': 'solver9_core', 'solver7': 'solver7_core'}
+DEFAULT_SOLVER = 'solver9'
+MODES = ('dfs', 'beam', 'mcts', 'exact')
+
+
+def load_engine(name):
+    if name not in SOLVERS:
+        raise ValueError(f"unknown solver: {name}")
+    return importlib.import_module(SOLVERS[name])
+
+
+# ---------------- Puzzle JSON ----------------
+def parse_puzzle(data, engine):
+    """(board, counts, pieces) of a puzzle dict; raises ValueError when malformed."""
+    if not isinstance(data, dict):
+        raise ValueError("puzzle must be a JSON object")
+
+    grid = data.get('board', 'initial')
+    if grid == 'initial':
+        board = engine.apply_initial_setup(engine.create_empty_board())
+    else:
+        if (not isinstance(grid, list) or len(grid) != BOARD_SIZE or
+                any(not isinstance(row, list) or len(row) != BOARD_SIZE for row in grid)):
+            raise ValueError(f"board must be 'initial' or {BOARD_SIZE} rows of {BOARD_SIZE} cells")
+        for row in grid:
+            for col in row:
+                if col is not None and col not in COLORS:
+                    raise ValueError(f"unknown color on board: {col!r}")
+        board = Board.from_grid(grid)
+
+    counts = {'yellow': 0, 'green': 0, 'red': 0}
+    given = data.get('counts') or {}
+    if not isinstance(given, dict):
+        raise ValueError("counts must be an object of color: count")
+    for col, n in given.items():
+        if col not in counts or type(n) is not int or n < 0:
+            raise ValueError(f"bad count: {col!r}: {n!r}")
+        counts[col] = n
+
+    given = data.get('pieces') or []
+    if not isinstance(given, list):
+        raise ValueError("pieces must be a list of pieces")
+    pieces = []
+    for piece in given:
+        if not isinstance(piece, list) or not piece:
+            raise ValueError("each piece must be a non-empty list of [dy, dx, color] blocks")
+        blocks = []
+        for block in piece:
+            if (not isinstance(block, list) or len(block) != 3 or
+                    not all(type(v) is int and 0 <= v < BOARD_SIZE for v in block[:2]) or
+                    not isinstance(block[2], str) or block[2] not in COLORS):
+                raise ValueError(f"bad block: {block!r}")
+            blocks.append(tuple(block))
+        pieces.append(Piece(blocks))
+    return board, counts, pieces
+
+def plan_to_json(plan):
+    if plan is None:
+        return None
+    steps = []
+    for idx, pos, cleared in plan:
+        r, c = pos if pos is not None else (None, None)
+        steps.append({'piece': idx, 'row': r, 'col': c, 'cleared': dict(cleared)})
+    return steps
+
+def solve_puzzle(data, engine, mode=None, workers=None, time_budget_ms=None,
+                 beam_width=None, iterations=None, with_stats=False, cache=None):
+    """The output dict for one puzzle dict, see the module docstring."""
+    board, counts, pieces = parse_puzzle(data, engine)
+    stats = SearchStats() if with_stats else None
+    certificate = Certificate() if (mode or engine.SOLVER_MODE) == 'exact' else None
+    plan = engine.suggest_best_sequence(board, counts, pieces, workers=workers,
+                                        time_budget_ms=time_budget_ms, mode=mode,
+                                        beam_width=beam_width, iterations=iterations,
+                                        stats=stats, cache=cache, certificate=certificate)
+    result = {'plan': plan_to_json(plan)}
+    if stats is not None:
+        result['stats'] = stats.as_dict()
+    if certificate is not None:
+        result['certificate'] = certificate.as_dict()
+    return result
+
+
+# ---------------- JSONL streams ----------------
+_STREAM_WORKER = None
+
+def _init_stream_worker(solver, options):
+    # options carry a cache_path; each process opens its own PlanCache
+    global _STREAM_WORKER
+    options = dict(options)
+    cache_path = options.pop('cache_path', None)
+    options['cache'] = PlanCache(cache_path) if cache_path else None
+    _STREAM_WORKER = (load_engine(solver), options)
+
+def _line_error(e):
+    # Error record of one line; a bad puzzle reads as its message, anything
+    # else (a cache error, a crashed worker) also names the exception
+    if isinstance(e, ValueError):
+        return {'error': str(e)}
+    return {'error': f"{type(e).__name__}: {e}"}
+
+def _solve_line(line):
+    engine, options = _STREAM_WORKER
+    try:
+        data = json.loads(line)
+        result = solve_puzzle(data, engine, **options)
+    except Exception as e:
+        return _line_error(e)
+    if 'id' in data:
+        result = {'id': data['id'], **result}
+    return result
+
+def solve_stream(lines, solver, options, jobs=1, window=None, ordered=False):
+    """
+    Yield (line number, result) for every non-blank line of puzzle JSON.
+    options are solve_puzzle keywords, with cache_path instead of cache; the
+    search inside each job is serial.
+    jobs is capped at the core count (0 = one per core), and at most window
+    lines (default 2 * jobs) are read ahead of the output.
+    """
+    options = dict(options, workers=1)
+    jobs = resolve_workers(jobs)
+    numbered = ((n, line) for n, line in enumerate(lines, start=1) if line.strip())
+    if jobs <= 1:
+        _init_stream_worker(solver, options)
+        for n, line in numbered:
+            yield n, _solve_line(line)
+        return
+
+    if window is None:
+        window = 2 * jobs
+    window = max(window, 1)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_stream_worker,
+                             initargs=(solver, options)) as pool:
+        pending = {}
+        finished = {}
+        order = deque()
+        exhausted = False
+        while True:
+            # Solved-but-unwritten results count against the window too
+            while not exhausted and len(pending) + len(finished) < window:
+                item = next(numbered, None)
+                if item is None:
+                    exhausted = True
+                    break
+                n, line = item
+                pending[pool.submit(_solve_line, line)] = n
+                order.append(n)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                n = pending.pop(f)
+                try:
+                    result = f.result()
+                except Exception as e:
+                    result = _line_error(e)
+                if ordered:
+                    finished[n] = result
+                else:
+                    yield n, result
+            if ordered:
+                while order and order[0] in finished:
+                    n = order.popleft()
+                    yield n, finished.pop(n)
+
+
+# ---------------- Main ----------------
+def add_solver_arguments(parser):
+    parser.add_argument('--solver', choices=sorted(SOLVERS), default=DEFAULT_SOLVER)
+    parser.add_argument('--mode', choices=MODES, default=None,
+                        help="search mode (default: the solver's SOLVER_MODE)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes for the DFS (0 = one per core)")
+    parser.add_argument('--time-budget-ms', type=int, default=None)
+    parser.add_argument('--beam-width', type=int, default=None)
+    parser.add_argument('--iterations', type=int, default=None, help="MCTS playouts")
+    parser.add_argument('--stats', action='store_true', help="include search statistics")
+    parser.add_argument('--cache', default=None, metavar='FILE',
+                        help="SQLite plan cache to read and fill")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve block puzzles given as JSON.")
+    parser.add_argument('puzzle', nargs='?', default='-',
+                        help="puzzle JSON (or JSONL) file, or - for stdin (default)")
+    add_solver_arguments(parser)
+    parser.add_argument('--indent', type=int, default=None)
+    parser.add_argument('--jsonl', action='store_true', help="one puzzle per line")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="processes for --jsonl (0 = one per core)")
+    parser.add_argument('--window', type=int, default=None,
+                        help="puzzles read ahead with --jsonl (default 2 * jobs)")
+    parser.add_argument('--ordered', action='store_true',
+                        help="write --jsonl results in input order")
+    args = parser.parse_args(argv)
+
+    if args.jsonl:
+        return main_jsonl(args)
+
+    try:
+        if args.puzzle == '-':
+            data = json.load(sys.stdin)
+        else:
+            with open(args.puzzle, encoding='utf-8') as f:
+                data = json.load(f)
+        engine = load_engine(args.solver)
+        cache = PlanCache(args.cache) if args.cache else None
+        result = solve_puzzle(data, engine, args.mode, args.workers, args.time_budget_ms,
+                              args.beam_width, args.iterations, args.stats, cache)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"solve.py: {e}", file=sys.stderr)
+        return 2
+
+    json.dump(result, sys.stdout, indent=args.indent)
+    sys.stdout.write('\n')
+    return 0
+
+def main_jsonl(args):
+    if args.solver not in SOLVERS:
+        print(f"solve.py: unknown solver: {args.solver}", file=sys.stderr)
+        return 2
+    options = {'mode': args.mode, 'time_budget_ms': args.time_budget_ms,
+               'beam_width': args.beam_width, 'iterations': args.iterations,
+               'with_stats': args.stats, 'cache_path': args.cache}
+    try:
+        src = sys.stdin if args.puzzle == '-' else open(args.puzzle, encoding='utf-8')
+    except OSError as e:
+        print(f"solve.py: {e}", file=sys.stderr)
+        return 2
+
+    failed = 0
+    with src:
+        for n, result in solve_stream(src, args.solver, options, args.jobs, args.window,
+                                      args.ordered):
+            if 'error' in result:
+                failed += 1
+            sys.stdout.write(json.dumps({'line': n, **result}) + '\n')
+            sys.stdout.flush()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,13 +10,18 @@ solver_final_with_buttons_and_previews_v2.py
 """
 import tkinter as tk
 from tkinter import ttk, messagebox
-import copy
-import itertools
-import math
+import multiprocessing
+import threading
+
+from bitboard import BOARD_SIZE, Piece, piece_masks, placement_index
+from plan_cache import open_plan_cache
+from search import SearchControl, SearchStats
+from solver7_core import (PREFERRED_COLS, PREFERRED_ROWS, TARGET, apply_initial_setup,
+                          convert_completed_colors_to_brown, create_empty_board,
+                          get_candidate_positions, is_goal, remaining_needed,
+                          score_candidate_strict, suggest_best_sequence)
 
 # ---------------- CONFIG ----------------
-BOARD_SIZE = 8
-TARGET = {'yellow': 10, 'green': 5, 'red': 5}
 COLOR_HEX = {
     'brown': '#8B4513',
     'yellow': '#FFD700',
@@ -24,243 +29,12 @@ COLOR_HEX = {
     'red': '#FF4500',
     None: '#FFFFFF'
 }
-HIGHLIGHT_COLOR = '#00BFFF'
 
-# Preferred rows fixed (0-based)
-PREFERRED_ROWS = [3, 4]
-# Preferred columns (edge columns)
-PREFERRED_COLS = [0, BOARD_SIZE-1]
-
-# Search/pruning parameters
-TOP_K_CANDIDATES = 30
-MAX_DFS_NODES = 45000
-
-# Weights (intentionally extreme so preferred-row logic dominates)
-PREF_ROW_COLOR_WEIGHT = {'green': 9000.0, 'red': 8500.0, 'yellow': 7000.0, 'brown': 10.0}
-PREF_COL_COLOR_WEIGHT = 2000.0
-COLUMN_DEFICIT_PENALTY_PER_DY = 2000.0
-PREFERRED_ROW_CLEAR_BONUS = 12000.0
-COLUMN_CLEAR_PENALTY = 10000.0
-OVERKILL_PENALTY = 12000.0
-POTENTIAL_WEIGHT = 0.5
-
-# ---------------- Utilities ----------------
-def create_empty_board():
-    return [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-
-def apply_initial_setup(board):
-    board[4][2] = 'red'
-    board[3][3] = 'yellow'
-    board[3][4] = 'green'
-    board[4][5] = 'brown'
-    return board
-
-def clear_lines(board):
-    cleared = {'yellow':0, 'green':0, 'red':0}
-    rows = [r for r in range(BOARD_SIZE) if all(board[r][c] is not None for c in range(BOARD_SIZE))]
-    cols = [c for c in range(BOARD_SIZE) if all(board[r][c] is not None for r in range(BOARD_SIZE))]
-    to_clear = set()
-    cleared_lines = []
-    for r in rows:
-        cleared_lines.append(('r', r))
-        for c in range(BOARD_SIZE):
-            to_clear.add((r, c))
-    for c in cols:
-        cleared_lines.append(('c', c))
-        for r in range(BOARD_SIZE):
-            to_clear.add((r, c))
-    for (r,c) in to_clear:
-        col = board[r][c]
-        if col in cleared:
-            cleared[col] += 1
-        board[r][c] = None
-    return cleared, cleared_lines
-
-def remaining_needed(counts):
-    return {col: max(0, TARGET[col] - counts.get(col,0)) for col in TARGET}
-
-def is_goal(counts):
-    return all(counts.get(col,0) >= TARGET[col] for col in TARGET)
-
-def convert_completed_colors_to_brown(board, counts):
-    for col in ('yellow','green','red'):
-        if counts.get(col,0) >= TARGET[col]:
-            for r in range(BOARD_SIZE):
-                for c in range(BOARD_SIZE):
-                    if board[r][c] == col:
-                        board[r][c] = 'brown'
-
-# ---------------- Candidate generation (no rotation) ----------------
-def get_candidate_positions(board, piece):
-    candidates = []
-    # special-case example preserved
-    if piece == [(0,0,'red'), (1,0,'green'), (2,0,'brown')]:
-        r, c = 3, 0
-        tb = copy.deepcopy(board)
-        for dy, dx, col in piece:
-            tb[r+dy][c+dx] = col
-        cleared, cleared_lines = clear_lines(tb)
-        candidates.append((r, c, cleared, cleared_lines, tb))
-        return candidates
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            ok = True
-            for dy, dx, _ in piece:
-                rr = r + dy; cc = c + dx
-                if not (0 <= rr < BOARD_SIZE and 0 <= cc < BOARD_SIZE) or board[rr][cc] is not None:
-                    ok = False; break
-            if not ok: continue
-            tb = copy.deepcopy(board)
-            for dy, dx, col in piece:
-                tb[r+dy][c+dx] = col
-            cleared, cleared_lines = clear_lines(tb)
-            candidates.append((r, c, cleared, cleared_lines, tb))
-    return candidates
-
-# ---------------- Scoring helpers ----------------
-def board_cluster_potential(board):
-    def runs(col):
-        s = 0
-        for r in range(BOARD_SIZE):
-            run = 0
-            for c in range(BOARD_SIZE):
-                if board[r][c] == col:
-                    run += 1
-                else:
-                    if run > 0:
-                        s += run*run
-                    run = 0
-            if run > 0: s += run*run
-        for c in range(BOARD_SIZE):
-            run = 0
-            for r in range(BOARD_SIZE):
-                if board[r][c] == col:
-                    run += 1
-                else:
-                    if run > 0:
-                        s += run*run
-                    run = 0
-            if run > 0: s += run*run
-        return s
-    return (runs('green') + runs('red')) * POTENTIAL_WEIGHT
-
-def score_candidate_strict(piece, r, c, cleared, cleared_lines, board_before, board_after, counts_before):
-    score = 0.0
-    pref_blocks_val = 0.0
-    for dy,dx,col in piece:
-        rr = r + dy
-        if rr in PREFERRED_ROWS:
-            pref_blocks_val += PREF_ROW_COLOR_WEIGHT.get(col, 50.0)
-    score += pref_blocks_val
-    pref_col_val = 0.0
-    for dy,dx,col in piece:
-        cc = c + dx
-        if cc in PREFERRED_COLS:
-            pref_col_val += PREF_COL_COLOR_WEIGHT
-    score += pref_col_val
-    vert_pen = sum(abs(dy) * COLUMN_DEFICIT_PENALTY_PER_DY for dy,dx,_ in piece)
-    score -= vert_pen
-    clear_bonus = 0.0; clear_penalty = 0.0
-    for typ, idx in cleared_lines:
-        if typ == 'r':
-            clear_bonus += PREFERRED_ROW_CLEAR_BONUS if idx in PREFERRED_ROWS else 100.0
-        else:
-            clear_penalty += COLUMN_CLEAR_PENALTY
-    score += clear_bonus - clear_penalty
-    for col in ('green','red','yellow'):
-        used = cleared.get(col, 0)
-        rem = max(0, TARGET[col] - counts_before.get(col, 0))
-        if used > rem:
-            score -= (used - rem) * OVERKILL_PENALTY
-    score += board_cluster_potential(board_after)
-    return score
-
-# ---------------- Simulation & search (unchanged) ----------------
-def simulate_permutation_plan(board, counts, pieces, perm):
-    initial = (0, copy.deepcopy(board), copy.deepcopy(counts), [])
-    best = None
-    nodes = 0
-    stack = [initial]
-    while stack:
-        nodes += 1
-        if nodes > MAX_DFS_NODES:
-            break
-        step, bstate, cstate, placements = stack.pop()
-        if step >= len(perm):
-            temp_counts = copy.deepcopy(counts)
-            step_reached = math.inf
-            for i, pl in enumerate(placements, start=1):
-                _,__,___, cleared, _ = pl
-                for col in ('green','red','yellow'):
-                    temp_counts[col] = temp_counts.get(col,0) + cleared.get(col,0)
-                if temp_counts.get('green',0) >= TARGET['green'] and temp_counts.get('red',0) >= TARGET['red'] and step_reached == math.inf:
-                    step_reached = i
-            if step_reached is math.inf:
-                step_reached = math.inf
-            total_pref_value = 0.0; total_over = 0
-            tmp = copy.deepcopy(counts)
-            for _,_,_, cleared, _ in placements:
-                for col in ('green','red','yellow'):
-                    used = min(cleared.get(col,0), max(0, TARGET[col] - tmp.get(col,0)))
-                    total_pref_value += used * 10.0
-                    over = max(0, cleared.get(col,0) - max(0, TARGET[col] - tmp.get(col,0)))
-                    total_over += over
-                    tmp[col] = tmp.get(col,0) + cleared.get(col,0)
-            score = total_pref_value - total_over * OVERKILL_PENALTY + board_cluster_potential(bstate)
-            cand = (step_reached, score, placements)
-            if best is None:
-                best = cand
-            else:
-                br = best
-                if cand[0] < br[0] or (cand[0] == br[0] and cand[1] > br[1]):
-                    best = cand
-            continue
-
-        idx = perm[step]
-        piece = pieces[idx]
-        cands = get_candidate_positions(bstate, piece)
-        if not cands:
-            new_placements = placements + [(idx, None, None, {'yellow':0,'green':0,'red':0}, [])]
-            stack.append((step+1, copy.deepcopy(bstate), copy.deepcopy(cstate), new_placements))
-            continue
+HIGHLIGHT_COLOR = '#00BFFF'
+SOLVE_POLL_MS = 100  # UI polling interval for a background solve
+SHOW_SEARCH_STATS = True  # show search counters and phase timings after each solve
+USE_PLAN_CACHE = True  # reuse solved plans stored on disk (plan_cache.PLAN_CACHE_FILE)
 
-        scored = []
-        for (r,c,cleared, cleared_lines, tb) in cands:
-            sc = score_candidate_strict(piece, r, c, cleared, cleared_lines, bstate, tb, cstate)
-            scored.append((sc, (r,c,cleared, cleared_lines, tb)))
-        scored.sort(reverse=True, key=lambda x: x[0])
-        top = scored[:TOP_K_CANDIDATES]
-        for sc, (r,c,cleared, cleared_lines, tb) in top:
-            nb = copy.deepcopy(tb)
-            nc = copy.deepcopy(cstate)
-            for col in cleared:
-                nc[col] = nc.get(col,0) + cleared[col]
-            new_placements = placements + [(idx, r, c, cleared, cleared_lines)]
-            stack.append((step+1, nb, nc, new_placements))
-    return best
-
-def suggest_best_sequence(board, counts, pieces):
-    if not pieces:
-        return None
-    best_overall = None
-    for perm in itertools.permutations(range(len(pieces))):
-        res = simulate_permutation_plan(board, counts, pieces, perm)
-        if res is None:
-            continue
-        steps_to_pref, score, placements = res
-        if best_overall is None:
-            best_overall = (steps_to_pref, score, placements, perm)
-        else:
-            bo = best_overall
-            if steps_to_pref < bo[0] or (steps_to_pref == bo[0] and score > bo[1]):
-                best_overall = (steps_to_pref, score, placements, perm)
-    if best_overall is None:
-        return None
-    _, _, placements, _ = best_overall
-    plan = []
-    for (idx, r, c, cleared, cleared_lines) in placements:
-        plan.append((idx, (r,c) if r is not None else None, cleared))
-    return plan
 
 # ---------------- UI ----------------
 class PieceEditor(tk.Toplevel):
@@ -338,7 +112,7 @@ class PieceEditor(tk.Toplevel):
             return
         minr = min(b[0] for b in blocks); minc = min(b[1] for b in blocks)
         rel = [(r-minr, c-minc, col) for r,c,col in blocks]
-        self.on_finish(rel)
+        self.on_finish(Piece(rel))
         self.destroy()
 
 class PuzzleApp:
@@ -353,6 +127,12 @@ class PuzzleApp:
         self.pieces = []
         self.piece_widgets = []
         self.highlight_rects = []
+        self.solve_thread = None
+        self.solve_control = None
+        self.solve_outcome = None
+        self.solve_snapshot = None
+        self.solve_done = None
+        self.plan_cache = open_plan_cache() if USE_PLAN_CACHE else None
         self._build_ui()
         self.update_board()
         self.update_counts()
@@ -378,6 +158,11 @@ class PuzzleApp:
         ttk.Button(btnf, text="Piece Editor", command=self.open_piece_editor).pack(side='left', padx=6)
         ttk.Button(btnf, text="Reset Board", command=self.reset_board).pack(side='left', padx=6)
         ttk.Button(right, text="計算して自動配置", command=self.compute_and_place_all).pack(pady=8)
+        solve_row = ttk.Frame(right); solve_row.pack(pady=2)
+        self.btn_cancel = ttk.Button(solve_row, text="キャンセル", command=self.cancel_solve, state='disabled')
+        self.btn_cancel.pack(side='left', padx=6)
+        self.label_progress = tk.Label(solve_row, text="")
+        self.label_progress.pack(side='left')
 
         ttk.Label(right, text="ピース一覧（プレビュー & 個別配置）").pack(pady=(6,2))
         # piece list area (wider)
@@ -398,6 +183,8 @@ class PuzzleApp:
         ttk.Label(right, text="AI提案（押すと計算します）").pack(pady=6)
         self.label_suggestion = tk.Label(right, text="", justify='left', anchor='w')
         self.label_suggestion.pack(fill='x')
+        self.label_stats = tk.Label(right, text="", justify='left', anchor='w', fg='gray30')
+        self.label_stats.pack(fill='x', pady=(6,0))
 
         # small help tooltip on canvas click
         self.canvas.bind("<ButtonPress-1>", lambda e: messagebox.showinfo("Info","ピース一覧の個別配置ボタンか、上の「計算して自動配置」を押してください。"))
@@ -405,7 +192,7 @@ class PuzzleApp:
     def update_board(self):
         for r in range(BOARD_SIZE):
             for c in range(BOARD_SIZE):
-                col = self.board[r][c]
+                col = self.board.cell(r, c)
                 self.canvas.itemconfig(self.rects[r][c], fill=COLOR_HEX[col])
         # ensure highlights on top
         for rect in self.highlight_rects:
@@ -430,7 +217,9 @@ class PuzzleApp:
         PieceEditor(self.master, self.add_piece, allowed)
 
     def add_piece(self, piece):
+        piece = Piece(piece)
         self.pieces.append(piece)
+        placement_index(piece)
         idx = len(self.pieces)-1
         rowf = ttk.Frame(self.pieces_frame, relief='ridge', padding=4)
         rowf.grid(row=idx, column=0, sticky='w', pady=2)
@@ -444,7 +233,7 @@ class PuzzleApp:
             rr = dy - minr; cc = dx - minc
             x1 = cc*preview_cell; y1 = rr*preview_cell; x2 = x1+preview_cell; y2 = y1+preview_cell
             canv.create_rectangle(x1,y1,x2,y2, fill=COLOR_HEX[col], outline='black')
-        txt = str(piece)
+        txt = str(list(piece))
         lbl = ttk.Label(rowf, text=txt, width=28, anchor='w')
         lbl.pack(side='left', padx=6)
         btn_place = ttk.Button(rowf, text="このピースを配置", command=lambda i=idx: self.place_single_piece_ui(i))
@@ -473,13 +262,76 @@ class PuzzleApp:
             except: pass
         self.highlight_rects = []
 
+    # ---- background solving (Tk is only touched from the main thread) ----
+    def start_solve(self, on_done):
+        if self.solve_thread is not None:
+            messagebox.showinfo("Info","既に計算中です。")
+            return
+        board = self.board.copy()
+        counts = dict(self.counts)
+        pieces = list(self.pieces)  # Pieces are immutable
+        control = SearchControl()
+        stats = SearchStats() if SHOW_SEARCH_STATS else None
+        outcome = {'stats': stats}
+        def work():
+            try:
+                outcome['plan'] = suggest_best_sequence(board, counts, pieces, control=control, stats=stats,
+                                                        cache=self.plan_cache)
+            except Exception as e:
+                outcome['error'] = e
+        self.solve_control = control
+        self.solve_outcome = outcome
+        self.solve_snapshot = (board, counts, pieces)
+        self.solve_done = on_done
+        self.solve_thread = threading.Thread(target=work, daemon=True)
+        self.solve_thread.start()
+        self.btn_cancel.config(state='normal')
+        self.label_progress.config(text="計算中...")
+        self.master.after(SOLVE_POLL_MS, self.poll_solve)
+
+    def poll_solve(self):
+        if self.solve_thread is None: return
+        control = self.solve_control
+        if self.solve_thread.is_alive():
+            self.label_progress.config(text=f"計算中... 初手 {control.moves_done}/{control.moves_total}  ノード {control.nodes:,}")
+            self.master.after(SOLVE_POLL_MS, self.poll_solve)
+            return
+        outcome = self.solve_outcome
+        board, counts, pieces = self.solve_snapshot
+        on_done = self.solve_done
+        self.solve_thread = self.solve_control = self.solve_outcome = None
+        self.solve_snapshot = self.solve_done = None
+        self.btn_cancel.config(state='disabled')
+        if control.cancelled:
+            self.label_progress.config(text="キャンセルしました。")
+            return
+        if 'error' in outcome:
+            self.label_progress.config(text="")
+            messagebox.showerror("エラー", f"計算に失敗しました: {outcome['error']}")
+            return
+        if self.board != board or self.counts != counts or self.pieces != pieces:
+            self.label_progress.config(text="計算中に盤面が変わったため結果を破棄しました。")
+            return
+        self.label_progress.config(text=f"完了（ノード {control.nodes:,}）")
+        stats = outcome['stats']
+        self.label_stats.config(text=stats.summary() if stats is not None else "")
+        on_done(outcome['plan'], pieces)
+
+    def cancel_solve(self):
+        if self.solve_control is not None:
+            self.solve_control.cancel()
+            self.label_progress.config(text="キャンセル中...")
+
     def update_ai(self):
         # display suggestion (does not auto-place)
-        self.clear_highlights()
         if not self.pieces:
+            self.clear_highlights()
             self.label_suggestion.config(text="")
             return
-        plan = suggest_best_sequence(self.board, self.counts, self.pieces)
+        self.start_solve(self.show_suggestion)
+
+    def show_suggestion(self, plan, pieces):
+        self.clear_highlights()
         if not plan:
             self.label_suggestion.config(text="配置提案なし")
             self.update_board()
@@ -506,26 +358,26 @@ class PuzzleApp:
             messagebox.showinfo("配置不可","配置可能な場所がありません。")
             return
         scored = []
-        for (r,c,cleared, cleared_lines, tb) in cands:
-            sc = score_candidate_strict(piece, r, c, cleared, cleared_lines, self.board, tb, self.counts)
-            scored.append((sc, (r,c,cleared, cleared_lines, tb)))
+        for (r,c,mask,color_masks) in cands:
+            cleared, cleared_lines, undo = self.board.make(mask, color_masks)
+            sc = score_candidate_strict(piece, r, c, cleared, cleared_lines, self.board, self.counts)
+            self.board.unmake(undo)
+            scored.append((sc, (r,c)))
         scored.sort(reverse=True, key=lambda x: x[0])
-        _, best = scored[0]
-        r,c,cleared, cleared_lines, tb = best
+        _, (r,c) = scored[0]
         ok = True
         for dy,dx,_ in piece:
             rr = r + dy; cc = c + dx
-            if not (0 <= rr < BOARD_SIZE and 0 <= cc < BOARD_SIZE) or self.board[rr][cc] is not None:
+            if not (0 <= rr < BOARD_SIZE and 0 <= cc < BOARD_SIZE) or self.board.cell(rr, cc) is not None:
                 ok = False; break
         if not ok:
             messagebox.showinfo("配置不可","提案位置に配置できません（既に塞がれています）。")
             return
         # clear previous highlights (user requested)
         self.clear_highlights()
-        # place
-        for dy,dx,col in piece:
-            self.board[r+dy][c+dx] = col
-        cleared_counts, cleared_lines2 = clear_lines(self.board)
+        # place (make keeps row/column fill counts up to date)
+        mask, color_masks = piece_masks(piece, r, c)
+        cleared_counts, cleared_lines2, _ = self.board.make(mask, color_masks)
         for k in cleared_counts:
             self.counts[k] = self.counts.get(k,0) + cleared_counts[k]
         convert_completed_colors_to_brown(self.board, self.counts)
@@ -535,7 +387,7 @@ class PuzzleApp:
         try:
             found_idx = None
             for i,p in enumerate(self.pieces):
-                if p == piece:
+                if p is piece:
                     found_idx = i; break
             if found_idx is not None:
                 w = self.piece_widgets[found_idx]
@@ -555,10 +407,11 @@ class PuzzleApp:
         if not self.pieces:
             messagebox.showinfo("Info","追加されたピースがありません。")
             return
+        self.start_solve(self.place_plan)
+
+    def place_plan(self, plan, pieces_snapshot):
         # clear previous highlights before auto placement (user requested)
         self.clear_highlights()
-        pieces_snapshot = copy.deepcopy(self.pieces)
-        plan = suggest_best_sequence(self.board, self.counts, pieces_snapshot)
         if not plan:
             messagebox.showinfo("Info","配置提案が見つかりませんでした。")
             return
@@ -572,13 +425,12 @@ class PuzzleApp:
             can_place = True
             for dy,dx,_ in piece:
                 rr = r + dy; cc = c + dx
-                if not (0 <= rr < BOARD_SIZE and 0 <= cc < BOARD_SIZE) or self.board[rr][cc] is not None:
+                if not (0 <= rr < BOARD_SIZE and 0 <= cc < BOARD_SIZE) or self.board.cell(rr, cc) is not None:
                     can_place = False; break
             if not can_place:
                 continue
-            for dy,dx,col in piece:
-                self.board[r+dy][c+dx] = col
-            cleared_counts, cleared_lines2 = clear_lines(self.board)
+            mask, color_masks = piece_masks(piece, r, c)
+            cleared_counts, cleared_lines2, _ = self.board.make(mask, color_masks)
             for k in cleared_counts:
                 self.counts[k] = self.counts.get(k,0) + cleared_counts[k]
             convert_completed_colors_to_brown(self.board, self.counts)
@@ -587,7 +439,7 @@ class PuzzleApp:
             placed_any = True
             # remove first matching piece from UI list
             for i,p in enumerate(self.pieces):
-                if p == piece:
+                if p is piece:
                     try:
                         w = self.piece_widgets[i]
                         w[0].destroy()
@@ -621,6 +473,7 @@ class PuzzleApp:
             except: pass
 
     def reset_board(self):
+        self.cancel_solve()
         self.board = apply_initial_setup(create_empty_board())
         self.counts = {'yellow':0,'green':0,'red':0}
         self.pieces = []
@@ -632,9 +485,11 @@ class PuzzleApp:
         self.update_board()
         self.update_counts()
         self.label_suggestion.config(text="")
+        self.label_stats.config(text="")
 
 # ---------------- main ----------------
 def main():
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = PuzzleApp(root)
     root.mainloop()
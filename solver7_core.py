@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Board, scoring and search of solver7.py (preferred rows 3-4 and the edge
+columns) without any GUI dependency, for scripts, batch jobs and the command
+line (solve.py).
+"""
+
+import math
+
+from bitboard import (BOARD_SIZE, Board, Piece, color_supply, live_cells, piece_masks,
+                      placement_index, placements_to_clear)
+from search import (Objective, TranspositionTable, WarmStart, distinct_orders, search_exact,
+                    search_plan, search_warm)
+
+# ---------------- CONFIG ----------------
+TARGET = {'yellow': 10, 'green': 5, 'red': 5}
+
+# Preferred rows fixed (0-based)
+PREFERRED_ROWS = [3, 4]
+# Preferred columns (edge columns)
+PREFERRED_COLS = [0, BOARD_SIZE-1]
+
+# Search/pruning parameters
+TOP_K_CANDIDATES = 30
+MAX_DFS_NODES = 45000
+SOLVER_WORKERS = 1  # worker processes for suggest_best_sequence (0 = one per core)
+SOLVE_TIME_BUDGET_MS = None  # anytime wall-clock budget in ms (None = MAX_DFS_NODES cap)
+SOLVER_MODE = 'dfs'  # 'dfs' = every piece order, 'beam' = BEAM_WIDTH best partial plans per depth, 'mcts', 'exact' = proven fewest placements
+BEAM_WIDTH = 64
+MCTS_ITERATIONS = 2000  # playouts per call in 'mcts' mode (unless a time budget is set)
+MCTS_ROLLOUT = 'greedy'  # 'greedy' or 'random'
+WARM_START = True  # keep DFS table and plan steps between calls on one board/counts
+EXACT_MAX_NODES = 500000  # 'exact' node cap; past it the plan is not proven minimal
+BATCH_SCORING = True  # NumPy batch scoring of all placements (used only if NumPy is installed)
+PRUNE_HOPELESS = True  # visit placements only in lines the remaining pieces can't fill last
+
+# Weights (intentionally extreme so preferred-row logic dominates)
+PREF_ROW_COLOR_WEIGHT = {'green': 9000.0, 'red': 8500.0, 'yellow': 7000.0, 'brown': 10.0}
+PREF_COL_COLOR_WEIGHT = 2000.0
+COLUMN_DEFICIT_PENALTY_PER_DY = 2000.0
+PREFERRED_ROW_CLEAR_BONUS = 12000.0
+COLUMN_CLEAR_PENALTY = 10000.0
+OVERKILL_PENALTY = 12000.0
+POTENTIAL_WEIGHT = 0.5
+
+
+# ---------------- Utilities ----------------
+def create_empty_board():
+    return Board()
+
+def apply_initial_setup(board):
+    board.set_cell(4, 2, 'red')
+    board.set_cell(3, 3, 'yellow')
+    board.set_cell(3, 4, 'green')
+    board.set_cell(4, 5, 'brown')
+    return board
+
+def clear_lines(board):
+    return board.clear_lines()
+
+def remaining_needed(counts):
+    return {col: max(0, TARGET[col] - counts.get(col,0)) for col in TARGET}
+
+def is_goal(counts):
+    return all(counts.get(col,0) >= TARGET[col] for col in TARGET)
+
+def convert_completed_colors_to_brown(board, counts):
+    for col in ('yellow','green','red'):
+        if counts.get(col,0) >= TARGET[col]:
+            board.recolor(col, 'brown')
+
+# ---------------- Candidate generation (no rotation) ----------------
+SPECIAL_PIECE = Piece([(0,0,'red'), (1,0,'green'), (2,0,'brown')])  # special-case example (overwrites)
+
+def get_candidate_positions(board, piece, index=None):
+    # (r, c, occ_mask, color_masks); apply with board.make, revert with board.unmake
+    if Piece(piece) is SPECIAL_PIECE:
+        r, c = 3, 0
+        mask, color_masks = piece_masks(piece, r, c)
+        return [(r, c, mask, tuple(color_masks))]
+    if index is None:
+        index = placement_index(piece)
+    return index.fitting(board.occ)
+
+# ---------------- Scoring helpers ----------------
+def board_cluster_potential(board):
+    return board.cluster_runs(('green', 'red')) * POTENTIAL_WEIGHT
+
+def score_candidate_strict(piece, r, c, cleared, cleared_lines, board_after, counts_before):
+    score = 0.0
+    pref_blocks_val = 0.0
+    for dy,dx,col in piece:
+        rr = r + dy
+        if rr in PREFERRED_ROWS:
+            pref_blocks_val += PREF_ROW_COLOR_WEIGHT.get(col, 50.0)
+    score += pref_blocks_val
+    pref_col_val = 0.0
+    for dy,dx,col in piece:
+        cc = c + dx
+        if cc in PREFERRED_COLS:
+            pref_col_val += PREF_COL_COLOR_WEIGHT
+    score += pref_col_val
+    vert_pen = sum(abs(dy) * COLUMN_DEFICIT_PENALTY_PER_DY for dy,dx,_ in piece)
+    score -= vert_pen
+    clear_bonus = 0.0; clear_penalty = 0.0
+    for typ, idx in cleared_lines:
+        if typ == 'r':
+            clear_bonus += PREFERRED_ROW_CLEAR_BONUS if idx in PREFERRED_ROWS else 100.0
+        else:
+            clear_penalty += COLUMN_CLEAR_PENALTY
+    score += clear_bonus - clear_penalty
+    for col in ('green','red','yellow'):
+        used = cleared.get(col, 0)
+        rem = max(0, TARGET[col] - counts_before.get(col, 0))
+        if used > rem:
+            score -= (used - rem) * OVERKILL_PENALTY
+    score += board_cluster_potential(board_after)
+    return score
+
+def top_candidates_batch(board, piece, index, counts_before, k):
+    # vectorized score_candidate_strict; every term but the potential is a whole
+    # number and the potential a multiple of 0.5, so sums are exact in any order
+    if Piece(piece) is SPECIAL_PIECE:
+        return None
+    # Imported on first use, like mcts and plan_cache below, so importing the
+    # solver does not load NumPy; without it the search keeps the scalar path
+    from batch import HAVE_NUMPY, np, placement_outcomes, top_placements
+    if not HAVE_NUMPY:
+        return None
+    out = placement_outcomes(board, piece, index)
+    if not len(out):
+        return [], 0
+    n = len(out)
+    pref_row = np.array([r in PREFERRED_ROWS for r in range(BOARD_SIZE)])
+    pref_col = np.array([c in PREFERRED_COLS for c in range(BOARD_SIZE)])
+    score = np.zeros(n)
+    for dy,dx,col in piece:
+        score += pref_row[out.r + dy] * PREF_ROW_COLOR_WEIGHT.get(col, 50.0)
+        score += pref_col[out.c + dx] * PREF_COL_COLOR_WEIGHT
+    score -= sum(abs(dy) * COLUMN_DEFICIT_PENALTY_PER_DY for dy,dx,_ in piece)
+    row_bonus = np.where(pref_row, PREFERRED_ROW_CLEAR_BONUS, 100.0)
+    score += out.full_rows @ row_bonus - out.full_cols.sum(axis=1) * COLUMN_CLEAR_PENALTY
+    for j, col in ((1, 'green'), (2, 'red'), (0, 'yellow')):
+        used = out.cleared[:, j]
+        rem = max(0, TARGET[col] - counts_before.get(col, 0))
+        score -= np.where(used > rem, (used - rem) * OVERKILL_PENALTY, 0.0)
+    score += out.runs * POTENTIAL_WEIGHT
+    return top_placements(out, score, k), n
+
+# ---------------- Plan scoring ----------------
+def placement_value(counts_before, cleared):
+    value = 0.0
+    for col in ('green','red','yellow'):
+        rem = max(0, TARGET[col] - counts_before.get(col,0))
+        value += min(cleared.get(col,0), rem) * 10.0
+        value -= max(0, cleared.get(col,0) - rem) * OVERKILL_PENALTY
+    return value
+
+def plan_bonus(counts):
+    return 0.0
+
+def green_and_red_done(counts):
+    return counts.get('green',0) >= TARGET['green'] and counts.get('red',0) >= TARGET['red']
+
+def steps_to_goal_bound(board, counts, pieces):
+    # admissible: both colors need enough supply, and any progress needs a clear
+    done = True
+    for col in ('green', 'red'):
+        need = TARGET[col] - counts.get(col, 0)
+        if need > 0:
+            if color_supply(board, pieces, col) < need:
+                return math.inf
+            done = False
+    if done:
+        return 0
+    return placements_to_clear(board.occ, pieces)
+
+def reachable_cells(board, pieces):
+    # cells in lines the remaining pieces can still complete
+    return live_cells(board.occ, pieces)
+
+OBJECTIVE = Objective(
+    candidates=get_candidate_positions,
+    score_candidate=score_candidate_strict,
+    placement_value=placement_value,
+    plan_bonus=plan_bonus,
+    goal_reached=green_and_red_done,
+    potential=board_cluster_potential,
+    steps_bound=steps_to_goal_bound,
+    top_candidates=top_candidates_batch if BATCH_SCORING else None,
+    complete=is_goal,
+    live_cells=reachable_cells if PRUNE_HOPELESS else None,
+    settled=green_and_red_done,
+)
+
+# ---------------- Simulation & search ----------------
+def simulate_permutation_plan(board, counts, pieces, perm, indexes=None, table=None, stats=None):
+    pieces = [Piece(p) for p in pieces]
+    if indexes is None:
+        indexes = [placement_index(p) for p in pieces]
+    return search_plan(board, counts, pieces, OBJECTIVE, indexes,
+                       TOP_K_CANDIDATES, MAX_DFS_NODES, table, perm, stats=stats)
+
+_MCTS_TREE = None  # kept between calls so MCTS can reuse its statistics
+_WARM_START = None  # kept between dfs calls, see search.WarmStart
+
+def suggest_best_sequence(board, counts, pieces, workers=None, control=None,
+                          time_budget_ms=None, mode=None, beam_width=None, iterations=None,
+                          stats=None, cache=None, certificate=None):
+    # stats: optional SearchStats to fill with counters and phase timings
+    # cache: optional PlanCache for dfs/beam solves without a time budget
+    # certificate: optional search.Certificate, filled in by mode 'exact'
+    global _MCTS_TREE, _WARM_START
+    if not pieces:
+        return None
+    pieces = [Piece(p) for p in pieces]  # interned: identical pieces are one object
+    if workers is None:
+        workers = SOLVER_WORKERS
+    if time_budget_ms is None:
+        time_budget_ms = SOLVE_TIME_BUDGET_MS
+    mode = mode or SOLVER_MODE
+    if mode not in ('dfs', 'beam', 'mcts', 'exact'):
+        raise ValueError(f"unknown solver mode: {mode}")
+    if mode == 'beam' and beam_width is None:
+        beam_width = BEAM_WIDTH
+    elif mode != 'beam':
+        beam_width = None
+    if cache is not None and mode in ('dfs', 'beam') and time_budget_ms is None:
+        # deterministic searches only; workers never change the plan
+        from plan_cache import config_fingerprint
+        config = config_fingerprint(globals())
+        variant = {'mode': mode, 'beam_width': beam_width}
+        plan = cache.get('solver7', config, board, counts, pieces, variant)
+        if plan is None:
+            plan = suggest_best_sequence(board, counts, pieces, workers, control,
+                                         mode=mode, beam_width=beam_width, stats=stats)
+            if plan is not None and not (control is not None and control.cancelled):
+                cache.put('solver7', config, board, counts, pieces, plan, variant)
+        return plan
+    indexes = [placement_index(p) for p in pieces]
+    if mode == 'mcts':
+        if iterations is None and time_budget_ms is None:
+            iterations = MCTS_ITERATIONS
+        from mcts import MCTSTree, search_mcts
+        if _MCTS_TREE is None:
+            _MCTS_TREE = MCTSTree(MCTS_ROLLOUT)
+        return plan_from_placements(search_mcts(board, counts, pieces, OBJECTIVE, indexes,
+                                                TOP_K_CANDIDATES, _MCTS_TREE, iterations,
+                                                time_budget_ms, control, stats))
+    if mode == 'exact':
+        # all placements count; the top-k beam only orders the pieces left over
+        return plan_from_placements(search_exact(board, counts, pieces, OBJECTIVE, indexes,
+                                                 TOP_K_CANDIDATES, EXACT_MAX_NODES, BEAM_WIDTH,
+                                                 control, time_budget_ms, stats, certificate))
+    # single (next piece, placement) tree; budget = MAX_DFS_NODES per distinct order
+    if mode == 'dfs' and time_budget_ms is None and WARM_START:
+        if _WARM_START is None:
+            _WARM_START = WarmStart()
+        return plan_from_placements(search_warm(_WARM_START, board, counts, pieces, OBJECTIVE,
+                                                indexes, TOP_K_CANDIDATES,
+                                                MAX_DFS_NODES * distinct_orders(pieces),
+                                                workers, control, stats))
+    best = search_plan(board, counts, pieces, OBJECTIVE, indexes, TOP_K_CANDIDATES,
+                       MAX_DFS_NODES * distinct_orders(pieces), TranspositionTable(),
+                       workers=workers, control=control, time_budget_ms=time_budget_ms,
+                       beam_width=beam_width, stats=stats)
+    return plan_from_placements(best)
+
+def plan_from_placements(best):
+    if best is None:
+        return None
+    _, _, placements = best
+    plan = []
+    for (idx, r, c, cleared, cleared_lines) in placements:
+        plan.append((idx, (r,c) if r is not None else None, cleared))
+    return plan
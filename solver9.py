@@ -9,14 +9,17 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
-import copy
-import itertools
-import math
+import multiprocessing
+import threading
 
-# ---------------- CONFIG ----------------
-BOARD_SIZE = 8
-TARGET = {'yellow': 10, 'green': 5, 'red': 5}
+from bitboard import BOARD_SIZE, Piece, piece_masks, placement_index
+from plan_cache import open_plan_cache
+from search import SearchControl, SearchStats
+from solver9_core import (TARGET, apply_initial_setup, convert_completed_colors_to_brown,
+                          create_empty_board, get_candidate_positions, is_goal,
+                          remaining_needed, score_candidate, suggest_best_sequence)
 
+# ---------------- CONFIG ----------------
 COLOR_HEX = {
     'brown': '#8B4513',
     'yellow': '#FFD700',
@@ -27,327 +30,12 @@ COLOR_HEX = {
 
 HIGHLIGHT_COLOR = '#00BFFF'
 
-# Search parameters
-TOP_K_CANDIDATES = 30
-MAX_DFS_NODES = 45000
-
-# Penalties / bonuses
-OVERKILL_PENALTY = 12000.0
-COLUMN_CLEAR_PENALTY = 10000.0
-
-# Weight constants for scoring
-WEIGHT_COLOR_PRIMARY = 1000.0
-WEIGHT_COLOR_YELLOW = 100.0
-NEAR_COMPLETE_BONUS_DIV = 3000.0
-ACHIEVEMENT_BONUS = 100000.0
-
-# No preferred rows/columns — user asked to remove highlight permanently
-# Therefore disable preferred bonuses
-POTENTIAL_WEIGHT = 0.1
-
-
-# ---------------- Utilities ----------------
-def create_empty_board():
-    return [[None for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
-
-def apply_initial_setup(board):
-    board[4][2] = 'red'
-    board[3][3] = 'yellow'
-    board[3][4] = 'green'
-    board[4][5] = 'brown'
-    return board
-
-def clear_lines(board):
-    cleared = {'yellow':0, 'green':0, 'red':0}
-    rows = [r for r in range(BOARD_SIZE)
-            if all(board[r][c] is not None for c in range(BOARD_SIZE))]
-    cols = [c for c in range(BOARD_SIZE)
-            if all(board[r][c] is not None for r in range(BOARD_SIZE))]
-    to_clear = set()
-    cleared_lines = []
-
-    for r in rows:
-        cleared_lines.append(('r', r))
-        for c in range(BOARD_SIZE):
-            to_clear.add((r, c))
-    for c in cols:
-        cleared_lines.append(('c', c))
-        for r in range(BOARD_SIZE):
-            to_clear.add((r, c))
-
-    for (r, c) in to_clear:
-        col = board[r][c]
-        if col in cleared:
-            cleared[col] += 1
-        board[r][c] = None
-
-    return cleared, cleared_lines
-
-def remaining_needed(counts):
-    return {col: max(0, TARGET[col] - counts.get(col,0)) for col in TARGET}
-
-def is_goal(counts):
-    return all(counts.get(col,0) >= TARGET[col] for col in TARGET)
-
-def convert_completed_colors_to_brown(board, counts):
-    for col in ('yellow','green','red'):
-        if counts.get(col,0) >= TARGET[col]:
-            for r in range(BOARD_SIZE):
-                for c in range(BOARD_SIZE):
-                    if board[r][c] == col:
-                        board[r][c] = 'brown'
-
-
-# ---------------- Candidate generation ----------------
-def get_candidate_positions(board, piece):
-    results = []
-
-    # Keep your special example logic
-    if piece == [(0,0,'red'), (1,0,'green'), (2,0,'brown')]:
-        r, c = 3, 0
-        tb = copy.deepcopy(board)
-        for dy, dx, col in piece:
-            tb[r + dy][c + dx] = col
-        cleared, cleared_lines = clear_lines(tb)
-        results.append((r, c, cleared, cleared_lines, tb))
-        return results
-
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            ok = True
-            for dy, dx, _ in piece:
-                rr = r + dy
-                cc = c + dx
-                if rr < 0 or rr >= BOARD_SIZE or cc < 0 or cc >= BOARD_SIZE:
-                    ok = False
-                    break
-                if board[rr][cc] is not None:
-                    ok = False
-                    break
-            if not ok:
-                continue
-
-            tb = copy.deepcopy(board)
-            for dy, dx, col in piece:
-                tb[r+dy][c+dx] = col
-            cleared, cleared_lines = clear_lines(tb)
-            results.append((r, c, cleared, cleared_lines, tb))
-
-    return results
-
-
-# ---------------- Scoring (English Version) ----------------
-def board_cluster_potential(board):
-    def runs(col):
-        s = 0
-        # rows
-        for r in range(BOARD_SIZE):
-            run = 0
-            for c in range(BOARD_SIZE):
-                if board[r][c] == col:
-                    run += 1
-                else:
-                    if run > 0:
-                        s += run * run
-                    run = 0
-            if run > 0:
-                s += run * run
-        # columns
-        for c in range(BOARD_SIZE):
-            run = 0
-            for r in range(BOARD_SIZE):
-                if board[r][c] == col:
-                    run += 1
-                else:
-                    if run > 0:
-                        s += run * run
-                    run = 0
-            if run > 0:
-                s += run * run
-        return s
-
-    return (runs('green') + runs('red')) * POTENTIAL_WEIGHT
-
-
-def score_candidate(piece, r, c, cleared, cleared_lines, board_before, board_after, counts_before):
-    rem_g = max(0, TARGET['green'] - counts_before.get('green', 0))
-    rem_r = max(0, TARGET['red']   - counts_before.get('red', 0))
-    rem_y = max(0, TARGET['yellow']- counts_before.get('yellow', 0))
-
-    gain_g = min(cleared.get('green', 0), rem_g)
-    gain_r = min(cleared.get('red',   0), rem_r)
-    gain_y = min(cleared.get('yellow',0), rem_y)
-
-    score = 0.0
-
-    # Primary gains (green + red)
-    score += WEIGHT_COLOR_PRIMARY * (gain_g + gain_r)
-    # Yellow lesser
-    score += WEIGHT_COLOR_YELLOW * gain_y
-
-    # Proximity bonus
-    rem_g_after = rem_g - gain_g
-    rem_r_after = rem_r - gain_r
-    score += NEAR_COMPLETE_BONUS_DIV / (rem_g_after + 1)
-    score += NEAR_COMPLETE_BONUS_DIV / (rem_r_after + 1)
-
-    # Achievement bonus
-    if rem_g_after <= 0:
-        score += ACHIEVEMENT_BONUS
-    if rem_r_after <= 0:
-        score += ACHIEVEMENT_BONUS
-
-    # Overkill penalties
-    for col in ('green','red','yellow'):
-        used = cleared.get(col, 0)
-        rem  = {'green':rem_g, 'red':rem_r, 'yellow':rem_y}[col]
-        if used > rem:
-            score -= (used - rem) * OVERKILL_PENALTY
-
-    # Column clear penalty
-    for typ, idx in cleared_lines:
-        if typ == 'c':
-            score -= COLUMN_CLEAR_PENALTY
-
-    # Small cluster potential
-    score += board_cluster_potential(board_after)
-
-    return score
-
-
-# ---------------- Simulation + search ----------------
-def simulate_permutation_plan(board, counts, pieces, perm):
-    initial = (0, copy.deepcopy(board), copy.deepcopy(counts), [])
-    stack = [initial]
-    best = None
-    nodes = 0
-
-    while stack:
-        nodes += 1
-        if nodes > MAX_DFS_NODES:
-            break
-
-        step, bstate, cstate, placements = stack.pop()
-
-        # End of permutation
-        if step >= len(perm):
-            temp_counts = copy.deepcopy(counts)
-            g_step = math.inf
-            r_step = math.inf
-
-            for i, pl in enumerate(placements, start=1):
-                _, _, _, cleared, _ = pl
-                for col in ('green','red','yellow'):
-                    temp_counts[col] = temp_counts.get(col,0) + cleared.get(col,0)
-                if temp_counts.get('green',0) >= TARGET['green'] and g_step == math.inf:
-                    g_step = i
-                if temp_counts.get('red',0)   >= TARGET['red']   and r_step == math.inf:
-                    r_step = i
-
-            earliest = min(g_step, r_step)
-
-            # leaf scoring
-            tmp = copy.deepcopy(counts)
-            total_score = 0.0
-            total_over = 0
-
-            for _,_,_, cleared,_ in placements:
-                for col in ('green','red','yellow'):
-                    rem = max(0, TARGET[col] - tmp.get(col,0))
-                    used = min(cleared.get(col,0), rem)
-                    if col in ('green','red'):
-                        total_score += WEIGHT_COLOR_PRIMARY * used
-                    else:
-                        total_score += WEIGHT_COLOR_YELLOW * used
-                    over = max(0, cleared.get(col,0) - rem)
-                    total_over += over
-                    tmp[col] = tmp.get(col,0) + cleared.get(col,0)
-
-            rem_g_fin = max(0, TARGET['green'] - tmp.get('green',0))
-            rem_r_fin = max(0, TARGET['red']   - tmp.get('red',0))
-
-            total_score += NEAR_COMPLETE_BONUS_DIV / (rem_g_fin + 1)
-            total_score += NEAR_COMPLETE_BONUS_DIV / (rem_r_fin + 1)
-            if rem_g_fin <= 0:
-                total_score += ACHIEVEMENT_BONUS
-            if rem_r_fin <= 0:
-                total_score += ACHIEVEMENT_BONUS
-
-            total_score -= total_over * OVERKILL_PENALTY
-            total_score += board_cluster_potential(bstate)
-
-            cand = (earliest, total_score, placements)
-
-            if best is None:
-                best = cand
-            else:
-                br = best
-                if (cand[0] < br[0]) or (cand[0] == br[0] and cand[1] > br[1]):
-                    best = cand
-
-            continue
-
-        # Not at leaf — expand
-        idx = perm[step]
-        piece = pieces[idx]
-        cands = get_candidate_positions(bstate, piece)
-
-        if not cands:
-            new_pl = placements + [(idx, None, None, {'yellow':0,'green':0,'red':0}, [])]
-            stack.append((step+1, copy.deepcopy(bstate), copy.deepcopy(cstate), new_pl))
-            continue
-
-        scored = []
-        for (r,c,cleared, cleared_lines, tb) in cands:
-            sc = score_candidate(piece, r, c, cleared, cleared_lines, bstate, tb, cstate)
-            scored.append((sc, (r,c,cleared, cleared_lines, tb)))
-        scored.sort(reverse=True, key=lambda x: x[0])
-        top = scored[:TOP_K_CANDIDATES]
-
-        for sc,(r,c,cleared, cleared_lines, tb) in top:
-            nb = copy.deepcopy(tb)
-            nc = copy.deepcopy(cstate)
-            for col in cleared:
-                nc[col] = nc.get(col,0) + cleared[col]
-            new_pl = placements + [(idx, r, c, cleared, cleared_lines)]
-            stack.append((step+1, nb, nc, new_pl))
-
-    return best
-
-
-def suggest_best_sequence(board, counts, pieces):
-    if not pieces:
-        return None
-
-    best_overall = None
-
-    for perm in itertools.permutations(range(len(pieces))):
-        res = simulate_permutation_plan(board, counts, pieces, perm)
-        if res is None:
-            continue
-
-        steps_to_finish, score, placements = res
-
-        if best_overall is None:
-            best_overall = (steps_to_finish, score, placements, perm)
-        else:
-            bo = best_overall
-            if (steps_to_finish < bo[0]) or (steps_to_finish == bo[0] and score > bo[1]):
-                best_overall = (steps_to_finish, score, placements, perm)
-
-    if best_overall is None:
-        return None
-
-    _, _, placements, _ = best_overall
-
-    plan = []
-    for (idx, r, c, cleared, cleared_lines) in placements:
-        if r is None:
-            plan.append((idx, None, cleared))
-        else:
-            plan.append((idx, (r,c), cleared))
-
-    return plan
+# How often the UI polls a background solve
+SOLVE_POLL_MS = 100
+# Show search counters and phase timings after each solve
+SHOW_SEARCH_STATS = True
+# Keep solved plans on disk (plan_cache.PLAN_CACHE_FILE) and reuse them
+USE_PLAN_CACHE = True
 
 
 # ---------------- UI (English) ----------------
@@ -452,7 +140,7 @@ class PieceEditor(tk.Toplevel):
         minc = min(b[1] for b in blocks)
         rel = [(r-minr, c-minc, col) for r,c,col in blocks]
 
-        self.on_finish(rel)
+        self.on_finish(Piece(rel))
         self.destroy()
 
 
@@ -470,6 +158,13 @@ class PuzzleApp:
         self.piece_widgets = []
         self.highlight_rects = []
 
+        self.solve_thread = None
+        self.solve_control = None
+        self.solve_outcome = None
+        self.solve_snapshot = None
+        self.solve_done = None
+        self.plan_cache = open_plan_cache() if USE_PLAN_CACHE else None
+
         self.build_ui()
         self.update_board()
         self.update_counts()
@@ -513,6 +208,13 @@ class PuzzleApp:
         ttk.Button(right, text="Auto Place Pieces", command=self.compute_and_place_all).pack(pady=8)
         ttk.Button(right, text="Show AI Suggestion", command=self.update_ai).pack(pady=2)
 
+        solve_row = ttk.Frame(right)
+        solve_row.pack(pady=2)
+        self.btn_cancel = ttk.Button(solve_row, text="Cancel", command=self.cancel_solve, state='disabled')
+        self.btn_cancel.pack(side='left', padx=6)
+        self.label_progress = tk.Label(solve_row, text="")
+        self.label_progress.pack(side='left')
+
         ttk.Label(right, text="Pieces (Preview & Manual Place):").pack(pady=(6,2))
 
         # Scroll area
@@ -543,6 +245,9 @@ class PuzzleApp:
         self.label_suggestion = tk.Label(right, text="", justify='left', anchor='w')
         self.label_suggestion.pack(fill='x')
 
+        self.label_stats = tk.Label(right, text="", justify='left', anchor='w', fg='gray30')
+        self.label_stats.pack(fill='x', pady=(6,0))
+
         self.canvas.bind(
             "<ButtonPress-1>",
             lambda e: messagebox.showinfo(
@@ -554,7 +259,7 @@ class PuzzleApp:
     def update_board(self):
         for r in range(BOARD_SIZE):
             for c in range(BOARD_SIZE):
-                col = self.board[r][c]
+                col = self.board.cell(r, c)
                 self.canvas.itemconfig(self.rects[r][c], fill=COLOR_HEX[col])
 
         for rect in self.highlight_rects:
@@ -590,7 +295,9 @@ class PuzzleApp:
         PieceEditor(self.master, self.add_piece, allowed)
 
     def add_piece(self, piece):
+        piece = Piece(piece)
         self.pieces.append(piece)
+        placement_index(piece)
         idx = len(self.pieces)-1
 
         rowf = ttk.Frame(self.pieces_frame, relief='ridge', padding=4)
@@ -618,7 +325,7 @@ class PuzzleApp:
             y2 = y1+preview_cell
             canv.create_rectangle(x1,y1,x2,y2, fill=COLOR_HEX[col], outline='black')
 
-        lbl = ttk.Label(rowf, text=str(piece), width=28, anchor='w')
+        lbl = ttk.Label(rowf, text=str(list(piece)), width=28, anchor='w')
         lbl.pack(side='left', padx=6)
 
         btn_place = ttk.Button(rowf, text="Place", command=lambda i=idx: self.place_single_piece(i))
@@ -659,14 +366,91 @@ class PuzzleApp:
                 pass
         self.highlight_rects = []
 
-    def update_ai(self):
-        self.clear_highlights()
+    # ---- Background solving ----
+    def start_solve(self, on_done):
+        if self.solve_thread is not None:
+            messagebox.showinfo("Info", "The solver is already running.")
+            return
+
+        board = self.board.copy()
+        counts = dict(self.counts)
+        pieces = list(self.pieces)  # Pieces are immutable
+        control = SearchControl()
+        stats = SearchStats() if SHOW_SEARCH_STATS else None
+        outcome = {'stats': stats}
+
+        def work():
+            try:
+                outcome['plan'] = suggest_best_sequence(board, counts, pieces, control=control,
+                                                        stats=stats, cache=self.plan_cache)
+            except Exception as e:
+                outcome['error'] = e
+
+        self.solve_control = control
+        self.solve_outcome = outcome
+        self.solve_snapshot = (board, counts, pieces)
+        self.solve_done = on_done
+        self.solve_thread = threading.Thread(target=work, daemon=True)
+        self.solve_thread.start()
+
+        self.btn_cancel.config(state='normal')
+        self.label_progress.config(text="Solving...")
+        self.master.after(SOLVE_POLL_MS, self.poll_solve)
+
+    def poll_solve(self):
+        if self.solve_thread is None:
+            return
+
+        control = self.solve_control
+        if self.solve_thread.is_alive():
+            self.label_progress.config(
+                text=f"Solving... first moves {control.moves_done}/{control.moves_total}, "
+                     f"nodes {control.nodes:,}"
+            )
+            self.master.after(SOLVE_POLL_MS, self.poll_solve)
+            return
+
+        outcome = self.solve_outcome
+        board, counts, pieces = self.solve_snapshot
+        on_done = self.solve_done
+        self.solve_thread = None
+        self.solve_control = None
+        self.solve_outcome = None
+        self.solve_snapshot = None
+        self.solve_done = None
+        self.btn_cancel.config(state='disabled')
+
+        if control.cancelled:
+            self.label_progress.config(text="Cancelled.")
+            return
+        if 'error' in outcome:
+            self.label_progress.config(text="")
+            messagebox.showerror("Error", f"Solver failed: {outcome['error']}")
+            return
+        if self.board != board or self.counts != counts or self.pieces != pieces:
+            self.label_progress.config(text="Board changed while solving; result discarded.")
+            return
+
+        self.label_progress.config(text=f"Done ({control.nodes:,} nodes).")
+        stats = outcome['stats']
+        self.label_stats.config(text=stats.summary() if stats is not None else "")
+        on_done(outcome['plan'], pieces)
+
+    def cancel_solve(self):
+        if self.solve_control is not None:
+            self.solve_control.cancel()
+            self.label_progress.config(text="Cancelling...")
 
+    def update_ai(self):
         if not self.pieces:
+            self.clear_highlights()
             self.label_suggestion.config(text="")
             return
 
-        plan = suggest_best_sequence(self.board, self.counts, self.pieces)
+        self.start_solve(self.show_suggestion)
+
+    def show_suggestion(self, plan, pieces):
+        self.clear_highlights()
 
         if not plan:
             self.label_suggestion.config(text="No suggestion found.")
@@ -706,12 +490,13 @@ class PuzzleApp:
             return
 
         scored = []
-        for (r,c,cleared, cleared_lines, tb) in cands:
-            sc = score_candidate(piece, r, c, cleared, cleared_lines, self.board, tb, self.counts)
-            scored.append((sc, (r,c,cleared, cleared_lines, tb)))
+        for (r, c, mask, color_masks) in cands:
+            cleared, cleared_lines, undo = self.board.make(mask, color_masks)
+            sc = score_candidate(piece, r, c, cleared, cleared_lines, self.board, self.counts)
+            self.board.unmake(undo)
+            scored.append((sc, (r, c)))
         scored.sort(reverse=True, key=lambda x: x[0])
-        _, best = scored[0]
-        r,c,cleared, cleared_lines, tb = best
+        _, (r, c) = scored[0]
 
         # Recheck placeability
         for dy,dx,_ in piece:
@@ -720,17 +505,15 @@ class PuzzleApp:
             if rr < 0 or rr >= BOARD_SIZE or cc < 0 or cc >= BOARD_SIZE:
                 messagebox.showinfo("Info","Invalid placement.")
                 return
-            if self.board[rr][cc] is not None:
+            if self.board.cell(rr, cc) is not None:
                 messagebox.showinfo("Info","That spot is already filled.")
                 return
 
         self.clear_highlights()
 
-        # Place
-        for dy,dx,col in piece:
-            self.board[r+dy][c+dx] = col
-
-        cleared_now, cleared_lines_now = clear_lines(self.board)
+        # Place; make keeps the line fill counts current
+        mask, color_masks = piece_masks(piece, r, c)
+        cleared_now, cleared_lines_now, _ = self.board.make(mask, color_masks)
         for k in cleared_now:
             self.counts[k] = self.counts.get(k,0) + cleared_now[k]
 
@@ -742,7 +525,7 @@ class PuzzleApp:
         try:
             found_idx = None
             for i,p in enumerate(self.pieces):
-                if p == piece:
+                if p is piece:
                     found_idx = i
                     break
             if found_idx is not None:
@@ -767,10 +550,10 @@ class PuzzleApp:
             messagebox.showinfo("Info", "No pieces added.")
             return
 
-        self.clear_highlights()
+        self.start_solve(self.place_plan)
 
-        pieces_snapshot = copy.deepcopy(self.pieces)
-        plan = suggest_best_sequence(self.board, self.counts, pieces_snapshot)
+    def place_plan(self, plan, pieces_snapshot):
+        self.clear_highlights()
 
         if not plan:
             messagebox.showinfo("Info", "No placement plan found.")
@@ -792,18 +575,16 @@ class PuzzleApp:
                 if rr < 0 or rr >= BOARD_SIZE or cc < 0 or cc >= BOARD_SIZE:
                     ok = False
                     break
-                if self.board[rr][cc] is not None:
+                if self.board.cell(rr, cc) is not None:
                     ok = False
                     break
 
             if not ok:
                 continue
 
-            # Place
-            for dy,dx,col in piece:
-                self.board[r+dy][c+dx] = col
-
-            cleared_now, cleared_lines_now = clear_lines(self.board)
+            # Place; make keeps the line fill counts current
+            mask, color_masks = piece_masks(piece, r, c)
+            cleared_now, cleared_lines_now, _ = self.board.make(mask, color_masks)
             for k in cleared_now:
                 self.counts[k] = self.counts.get(k,0) + cleared_now[k]
 
@@ -814,7 +595,7 @@ class PuzzleApp:
 
             # Remove from UI list
             for i,p in enumerate(self.pieces):
-                if p == piece:
+                if p is piece:
                     w = self.piece_widgets[i]
                     try:
                         w[0].destroy()
@@ -855,6 +636,7 @@ class PuzzleApp:
                 pass
 
     def reset_board(self):
+        self.cancel_solve()
         self.board = apply_initial_setup(create_empty_board())
         self.counts = {'yellow':0,'green':0,'red':0}
         self.pieces = []
@@ -870,10 +652,12 @@ class PuzzleApp:
         self.update_board()
         self.update_counts()
         self.label_suggestion.config(text="")
+        self.label_stats.config(text="")
 
 
 # ---------------- main ----------------
 def main():
+    multiprocessing.freeze_support()
     root = tk.Tk()
     PuzzleApp(root)
     root.mainloop()
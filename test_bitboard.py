@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks of the bitboard against plain grid scans, of the NumPy batch ranking
+against the scalar one, and of the plans the searches pick on small inputs.
+Run with: python -m pytest test_bitboard.py
+"""
+
+import itertools
+import json
+import math
+import os
+import random
+import unittest
+from unittest import mock
+
+import solver7_core
+import solver9_core
+from batch import HAVE_NUMPY
+from bitboard import (BOARD_SIZE, CLEAR_COLORS, COLORS, RUN_COLORS, Board, Piece,
+                      piece_masks, placement_index)
+from search import (NO_CLEAR, Certificate, TranspositionTable, distinct_orders, search_exact,
+                    search_plan)
+
+CORES = (solver9_core, solver7_core)
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus.json')
+
+
+def load_cases():
+    with open(CORPUS) as f:
+        return json.load(f)['cases']
+
+def load_pieces():
+    pieces = {Piece(p) for case in load_cases() for p in case['pieces']}
+    return sorted(pieces, key=repr)
+
+def small_cases(core, max_pieces=3):
+    # (name, board, counts, pieces) of the corpus cases with few pieces
+    cases = []
+    for case in load_cases():
+        if len(case['pieces']) <= max_pieces:
+            if case['board'] == 'initial':
+                board = core.apply_initial_setup(core.create_empty_board())
+            else:
+                board = Board.from_grid(case['board'])
+            counts = {col: case['counts'].get(col, 0) for col in CLEAR_COLORS}
+            cases.append((case['name'], board, counts, [Piece(p) for p in case['pieces']]))
+    return cases
+
+def random_board(rng, density):
+    grid = [[rng.choice(COLORS) if rng.random() < density else None
+             for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+    return Board.from_grid(grid)
+
+def random_case(rng, core, n_pieces, pieces):
+    # A random board and counts a few clears short of the targets
+    board = random_board(rng, rng.choice((0.4, 0.6, 0.75)))
+    counts = {col: max(0, core.TARGET[col] - rng.randint(1, 4)) for col in CLEAR_COLORS}
+    return board, counts, [rng.choice(pieces) for _ in range(n_pieces)]
+
+def state(board):
+    return (board.key(), board.rows, board.cols, list(board.tmasks), list(board.runs))
+
+def grid_line_counts(grid):
+    rows = [sum(cell is not None for cell in row) for row in grid]
+    cols = [sum(row[c] is not None for row in grid) for c in range(BOARD_SIZE)]
+    return rows, cols
+
+def nibbles(packed):
+    return [(packed >> (4 * i)) & 0xF for i in range(BOARD_SIZE)]
+
+def grid_cluster_runs(grid, colors):
+    s = 0
+    lines = [row for row in grid] + [[row[c] for row in grid] for c in range(BOARD_SIZE)]
+    for line in lines:
+        run = 0
+        prev = None
+        for cell in line + [None]:
+            if cell is not None and cell == prev:
+                run += 1
+            else:
+                if prev in colors:
+                    s += run * run
+                run = 1
+            prev = cell
+    return s
+
+def scalar_top(objective, board, piece, index, counts, k):
+    # PlanSearch.top_candidates without the batch hook
+    scored = []
+    for r, c, occ_mask, color_masks in objective.candidates(board, piece, index):
+        cleared, cleared_lines, undo = board.make(occ_mask, color_masks)
+        sc = objective.score_candidate(piece, r, c, cleared, cleared_lines, board, counts)
+        board.unmake(undo)
+        scored.append((sc, (r, c, occ_mask, color_masks, cleared, cleared_lines)))
+    scored.sort(reverse=True, key=lambda x: x[0])
+    return [cand for _, cand in scored[:k]], len(scored)
+
+def replay(objective, board, counts, pieces, placements):
+    # (steps, score) of a plan given as [(idx, r, c, cleared)], checking that
+    # every placement clears what the plan says
+    board = board.copy()
+    counts = dict(counts)
+    value = 0.0
+    steps = math.inf
+    for step, (idx, r, c, cleared) in enumerate(placements, start=1):
+        done = {col: 0 for col in CLEAR_COLORS}
+        if r is not None:
+            done.update(board.make(*piece_masks(pieces[idx], r, c))[0])
+        assert {col: cleared.get(col, 0) for col in CLEAR_COLORS} == done
+        value += objective.placement_value(counts, cleared)
+        for col in cleared:
+            counts[col] += cleared[col]
+        if steps == math.inf and objective.goal_reached(counts):
+            steps = step
+    return steps, value + objective.plan_bonus(counts) + objective.potential(board)
+
+def reference_plan(objective, board, counts, pieces, top_k):
+    """
+    (steps, score) of the best plan by brute force, the way the search
+    before the shared tree worked: every piece order, and below each piece
+    its top_k candidates by score_candidate, all the way to the last piece.
+    """
+    board = board.copy()
+    counts = dict(counts)
+    best = [None]
+
+    def visit(order, value, steps):
+        if not order:
+            score = value + objective.plan_bonus(counts) + objective.potential(board)
+            if best[0] is None or (steps, -score) < (best[0][0], -best[0][1]):
+                best[0] = (steps, score)
+            return
+        piece = pieces[order[0]]
+        top = scalar_top(objective, board, piece, placement_index(piece), counts, top_k)[0]
+        for cand in top or [None]:
+            undo = None
+            cleared = NO_CLEAR
+            if cand is not None:
+                cleared, _, undo = board.make(cand[2], cand[3])
+            v = objective.placement_value(counts, cleared)
+            for col in cleared:
+                counts[col] += cleared[col]
+            reached = steps
+            if steps == math.inf and objective.goal_reached(counts):
+                reached = len(pieces) - len(order) + 1
+            visit(order[1:], value + v, reached)
+            for col in cleared:
+                counts[col] -= cleared[col]
+            if undo is not None:
+                board.unmake(undo)
+
+    for order in set(itertools.permutations(range(len(pieces)))):
+        visit(order, 0.0, math.inf)
+    return best[0]
+
+def fewest_steps(objective, board, counts, pieces, limit):
+    # Fewest placements of any of the pieces, in any order and on any
+    # candidate, that reach goal_reached; inf when none within limit does
+    if objective.goal_reached(counts):
+        return 0
+    if not limit or not pieces:
+        return math.inf
+    best = math.inf
+    for i, piece in enumerate(pieces):
+        if piece in pieces[:i]:
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        for r, c, occ_mask, color_masks in objective.candidates(
+                board, piece, placement_index(piece)):
+            cleared, _, undo = board.make(occ_mask, color_masks)
+            for col in cleared:
+                counts[col] += cleared[col]
+            steps = 1 + fewest_steps(objective, board, counts, rest, min(limit, best - 1) - 1)
+            for col in cleared:
+                counts[col] -= cleared[col]
+            board.unmake(undo)
+            best = min(best, steps)
+            if best == 1:
+                return 1
+    return best
+
+def suggest(core, board, counts, pieces):
+    # suggest_best_sequence without the warm start kept between calls
+    with mock.patch.object(core, 'WARM_START', False):
+        plan = core.suggest_best_sequence(board.copy(), dict(counts), pieces, workers=1)
+    return [(idx, *(pos if pos is not None else (None, None)), cleared)
+            for idx, pos, cleared in plan]
+
+
+class BoardTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(7)
+        self.pieces = load_pieces()
+
+    def test_make_unmake_round_trip(self):
+        rng = self.rng
+        for _ in range(300):
+            board = random_board(rng, rng.choice((0.3, 0.6, 0.85)))
+            before = state(board)
+            undos = []
+            for _ in range(rng.randint(1, 4)):
+                r, c, occ_mask, color_masks = rng.choice(
+                    placement_index(rng.choice(self.pieces)).placements)
+                undos.append(board.make(occ_mask, color_masks)[2])
+                # Incremental counts and runs match a board built from scratch
+                self.assertEqual(state(board), state(Board(board.occ, board.masks[:])))
+            for undo in reversed(undos):
+                board.unmake(undo)
+            self.assertEqual(state(board), before)
+
+    def test_make_clears_full_lines(self):
+        board = Board()
+        for c in range(BOARD_SIZE - 1):
+            board.set_cell(2, c, 'green')
+        r, c, occ_mask, color_masks = next(
+            pl for pl in placement_index(Piece([(0, 0, 'red')])).placements
+            if pl[:2] == (2, BOARD_SIZE - 1))
+        cleared, cleared_lines, undo = board.make(occ_mask, color_masks)
+        self.assertEqual(cleared_lines, [('r', 2)])
+        self.assertEqual(cleared, {'yellow': 0, 'green': BOARD_SIZE - 1, 'red': 1})
+        self.assertEqual(board.occ, 0)
+        board.unmake(undo)
+        self.assertEqual(board.cell(2, BOARD_SIZE - 1), None)
+        self.assertEqual(board.cell(2, 0), 'green')
+
+    def test_line_counts(self):
+        rng = self.rng
+        for _ in range(200):
+            board = random_board(rng, rng.random())
+            for _ in range(3):
+                r, c, occ_mask, color_masks = rng.choice(
+                    placement_index(rng.choice(self.pieces)).placements)
+                board.make(occ_mask, color_masks)
+            rows, cols = grid_line_counts(board.to_grid())
+            self.assertEqual(nibbles(board.rows), rows)
+            self.assertEqual(nibbles(board.cols), cols)
+
+    def test_cluster_runs(self):
+        rng = self.rng
+        for _ in range(200):
+            board = random_board(rng, rng.random())
+            r, c, occ_mask, color_masks = rng.choice(
+                placement_index(rng.choice(self.pieces)).placements)
+            board.make(occ_mask, color_masks)
+            grid = board.to_grid()
+            for colors in (RUN_COLORS, CLEAR_COLORS, COLORS, ('yellow',)):
+                self.assertEqual(board.cluster_runs(colors), grid_cluster_runs(grid, colors))
+
+
+@unittest.skipUnless(HAVE_NUMPY, "NumPy is not installed")
+class BatchRankingTest(unittest.TestCase):
+    def test_batch_matches_scalar(self):
+        rng = random.Random(11)
+        pieces = load_pieces()
+        for core in (solver9_core, solver7_core):
+            objective = core.OBJECTIVE
+            with self.subTest(core=core.__name__):
+                for _ in range(60):
+                    board = random_board(rng, rng.choice((0.2, 0.5, 0.75)))
+                    counts = {col: rng.randint(0, core.TARGET[col] + 1) for col in CLEAR_COLORS}
+                    piece = rng.choice(pieces)
+                    index = placement_index(piece)
+                    batch = core.top_candidates_batch(board, piece, index, counts, 1000)
+                    if batch is None:
+                        continue
+                    self.assertEqual(batch, scalar_top(objective, board, piece, index, counts, 1000))
+
+
+class SearchTest(unittest.TestCase):
+    TOP_K = 5
+
+    def check_reference(self, core, board, counts, pieces):
+        objective = core.OBJECTIVE
+        indexes = [placement_index(p) for p in pieces]
+        ref = reference_plan(objective, board, counts, pieces, self.TOP_K)
+        max_nodes = core.MAX_DFS_NODES * distinct_orders(pieces)
+        # Without settled the search branches all the way down, like the reference
+        with mock.patch.object(objective, 'settled', None):
+            steps, score, placements = search_plan(board.copy(), dict(counts), pieces, objective,
+                                                   indexes, self.TOP_K, max_nodes,
+                                                   TranspositionTable())
+        self.assertEqual(steps, ref[0])
+        self.assertAlmostEqual(score, ref[1], places=6)
+        replayed = replay(objective, board, counts, pieces, [pl[:4] for pl in placements])
+        self.assertEqual(replayed[0], steps)
+        self.assertAlmostEqual(replayed[1], score, places=6)
+        # tail() below settled states keeps the steps and never beats the reference
+        steps, score, _ = search_plan(board.copy(), dict(counts), pieces, objective, indexes,
+                                      self.TOP_K, max_nodes, TranspositionTable())
+        self.assertEqual(steps, ref[0])
+        self.assertLessEqual(score, ref[1] + 1e-6)
+
+    def test_plan_search_matches_brute_force(self):
+        rng = random.Random(3)
+        pieces = load_pieces()
+        for core in CORES:
+            for name, board, counts, case_pieces in small_cases(core):
+                with self.subTest(core=core.__name__, case=name):
+                    self.check_reference(core, board, counts, case_pieces)
+            for i in range(30):
+                board, counts, case_pieces = random_case(rng, core, i % 3 + 1, pieces)
+                with self.subTest(core=core.__name__, case=i):
+                    self.check_reference(core, board, counts, case_pieces)
+
+    def test_hopeless_placements_keep_the_plan(self):
+        # Placements outside live_cells clear nothing and so risk no overkill;
+        # they can be the best move (mid1-1p with solver7) and must stay
+        for core in CORES:
+            objective = core.OBJECTIVE
+            for name, board, counts, pieces in small_cases(core):
+                with self.subTest(core=core.__name__, case=name):
+                    pruned = replay(objective, board, counts, pieces,
+                                    suggest(core, board, counts, pieces))
+                    with mock.patch.object(objective, 'live_cells', None):
+                        plain = replay(objective, board, counts, pieces,
+                                       suggest(core, board, counts, pieces))
+                    self.assertEqual(pruned[0], plain[0])
+                    self.assertAlmostEqual(pruned[1], plain[1], places=6)
+
+    def test_exact_certificate(self):
+        rng = random.Random(5)
+        pieces = load_pieces()
+        for core in CORES:
+            objective = core.OBJECTIVE
+            for i in range(40):
+                board, counts, case_pieces = random_case(rng, core, i % 3 + 1, pieces)
+                with self.subTest(core=core.__name__, case=i):
+                    certificate = Certificate()
+                    steps, _, placements = search_exact(
+                        board.copy(), dict(counts), case_pieces, objective,
+                        [placement_index(p) for p in case_pieces], core.TOP_K_CANDIDATES,
+                        core.EXACT_MAX_NODES, core.BEAM_WIDTH, certificate=certificate)
+                    self.assertTrue(certificate.proven)
+                    self.assertEqual(certificate.steps,
+                                     fewest_steps(objective, board.copy(), dict(counts),
+                                                  case_pieces, len(case_pieces)))
+                    if certificate.steps < math.inf:
+                        self.assertEqual(steps, certificate.steps)
+                        self.assertEqual(replay(objective, board, counts, case_pieces,
+                                                [pl[:4] for pl in placements])[0],
+                                         certificate.steps)
+
+
+if __name__ == '__main__':
+    unittest.main()